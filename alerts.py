@@ -1,7 +1,7 @@
 import asyncio
-from discord.ext import tasks
 import discord
-from sqlalchemy import select, update, delete, and_
+import os
+from sqlalchemy import select, insert, update, delete, and_, func, tuple_
 from models import (
     Session,
     GamerPowerData,
@@ -13,52 +13,191 @@ from models import (
     PriceAlerts,
     LocalGiveaways,
     SteamFreeGamesCalendar,
+    UpcomingSteamSales,
+    ServerSettings,
+    Deliveries,
+    read_session,
+    mark_written,
+    format_price,
+    stream_records,
 )
 from typing import Union
 import traceback
-from datetime import datetime
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
 from sqlalchemy.inspection import inspect
 import random
+import re
 
+import startup
 from bot import bot
-from price import price_comparison, get_itad_overviews, PriceInfo
+from diagnostics import report
+from price import (
+    price_comparison,
+    get_itad_overviews,
+    get_itad_infos,
+    get_itad_plains,
+    get_steam_appids,
+    PriceInfo,
+)
+from scheduler import DeadlineScheduler
+from supervisor import supervised
+from query_profiler import profiler
+from votes import vote_ledger
+from price_history import price_history
+from polling import poll_scheduler
 
 alert_tables = [FreeToPlayAlerts, GiveawayAlerts, GamePassAlerts, PriceAlerts]
 
+# Discord error codes that mean a channel will never accept our messages.
+PERMANENT_ERRORS = {10003: "Unknown Channel", 50001: "Missing Access"}
+
+# Discord limits for a single message.
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+
+# Alert limits per server, the higher one applies to users who voted.
+MAX_ALERTS = 10
+MAX_ALERTS_WITHOUT_VOTE = 5
+
+# Rows streamed per chunk by the alert loops.
+ALERT_CHUNK_SIZE = 5 * MAX_EMBEDS_PER_MESSAGE
+
+# With a delivery queue, the alert loops only build messages and the
+# delivery workers send them.
+QUEUE_DELIVERIES = os.getenv("DELIVERY_QUEUE") == "1"
+
+# Delay before a giveaway without voters or with a failed key DM is drawn again.
+GIVEAWAY_RETRY = timedelta(minutes=30)
+
 
 def server_alert_count(server_id: int) -> int:
     count = 0
     with Session() as session:
         for alert in alert_tables:
-            stmt = select(alert).where(alert.server == server_id)
-            result = session.execute(stmt).scalars().all()
-            count += len(result)
+            stmt = select(func.count()).where(alert.server == server_id)
+            count += session.execute(stmt).scalar()
     return count
 
 
-async def alert_check(server_id: int, user_id: int):
+def alert_quota(server_id: int, user_id: int) -> tuple[int, str]:
+    """Returns how many more alerts the user can create on a server and the
+    response to show once none can."""
 
     alert_count = server_alert_count(server_id)
 
-    if alert_count >= 10:
+    if alert_count >= MAX_ALERTS:
         response = (
             "You've reached the maximum allowed alerts for this server. "
             "Please delete an alert to set a new one."
         )
-        return response
+        return 0, response
 
-    elif alert_count >= 5:
-        if not await bot.topggpy.get_user_vote(user_id):
-            response = (
-                "You've reached the alert limit for this server. "
-                "You can increase the alert limit by [voting on Top.gg]"
-                "(https://top.gg/bot/1028073862597967932/vote)"
-            )
-            return response
-    
+    elif vote_ledger.has_voted(user_id):
+        return MAX_ALERTS - alert_count, None
+
+    response = (
+        "You've reached the alert limit for this server. "
+        "You can increase the alert limit by [voting on Top.gg]"
+        "(https://top.gg/bot/1028073862597967932/vote)"
+    )
+    return max(MAX_ALERTS_WITHOUT_VOTE - alert_count, 0), response
+
+
+async def alert_check(server_id: int, user_id: int):
+    remaining, response = alert_quota(server_id, user_id)
+    if remaining <= 0:
+        return response
     return True
 
 
+def parse_watchlist(text: str, default_price: float) -> list[tuple]:
+    """Parses one title, steam app id or store link per line. A line can
+    override the target price with `| price`."""
+    entries = []
+    for line in text.splitlines():
+        entry, _, price = line.partition("|")
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            price = float(price.strip().replace("$", "")) if price.strip() else None
+        except ValueError:
+            price = None
+        app_id = re.fullmatch(r"\d+", entry) or re.search(r"app/(\d+)", entry)
+        app_id = int(app_id.group(app_id.lastindex or 0)) if app_id else None
+        entries.append((entry, app_id, price if price is not None else default_price))
+    return entries
+
+
+async def import_watchlist(
+    interaction: discord.Interaction, text: str, default_price: float
+) -> str:
+    """Creates price alerts for many games at once. Titles are matched to
+    steam app ids locally, app ids are resolved to plains and then to
+    overviews and info in batched ITAD requests, and the alerts are inserted
+    in one bulk insert. The server's alert quota still applies."""
+    remaining, response = alert_quota(interaction.guild.id, interaction.user.id)
+    if remaining <= 0:
+        return response
+    region = ServerSettings.get_region(interaction.guild.id)
+    entries = parse_watchlist(text, default_price)
+    titles = [entry for entry, app_id, _ in entries if app_id is None]
+    title_appids = get_steam_appids(titles) if titles else {}
+    entries = [
+        (entry, app_id or title_appids.get(entry), price)
+        for entry, app_id, price in entries
+    ]
+    plains = await get_itad_plains(list({app_id for _, app_id, _ in entries if app_id}))
+    unique_plains = list(set(plains.values()))
+    overviews = await get_itad_overviews(unique_plains, region)
+    infos = await get_itad_infos(unique_plains)
+    price_history.record_overviews(overviews, region)
+
+    rows, created, missing, over_quota = [], [], [], 0
+    for entry, app_id, price in entries:
+        plain = plains.get(app_id)
+        if not plain:
+            missing.append(entry)
+            continue
+        if len(rows) >= remaining:
+            over_quota += 1
+            continue
+        info = infos.get(plain) or {}
+        name = info.get("title") or entry
+        image = info.get("image") or (
+            f"https://cdn.cloudflare.steamstatic.com/steam/apps/{app_id}/header.jpg"
+        )
+        rows.append(
+            {
+                "user": interaction.user.id,
+                "server": interaction.guild.id,
+                "channel": interaction.channel_id,
+                "price": round(price, 2),
+                "region": region,
+                "game_plain": plain,
+                "game_name": name,
+                "image_url": image,
+                "creation_time": datetime.now(),
+            }
+        )
+        current = ((overviews.get(plain) or {}).get("price") or {}).get(
+            "price_formatted", "?"
+        )
+        created.append(f"`{name}` under {format_price(price, region)} (now {current})")
+    if rows:
+        PriceAlerts.add_alerts(rows)
+
+    lines = [f"Created {len(rows)} price alerts."] + created[:15]
+    if len(created) > 15:
+        lines.append(f"...and {len(created) - 15} more.")
+    if missing:
+        lines.append(f"Could not find: {', '.join(missing)[:500]}")
+    if over_quota:
+        lines.append(f"{over_quota} games were skipped. {response or ''}")
+    return "\n".join(lines)[:1900]
+
+
 def delete_server_alerts(
     server_id: int,
     alert_type: Union[FreeToPlayAlerts, GiveawayAlerts, GamePassAlerts, PriceAlerts],
@@ -68,6 +207,7 @@ def delete_server_alerts(
 ) -> None:
     """Deletes all active alerts given a server id and alert table type.
     This is the primary way for users to delete active alerts."""
+    mark_written(server_id)
     if type(alert_type) == PriceAlerts:
         with Session() as session:
             stmt = delete(alert_type).where(
@@ -85,127 +225,279 @@ def delete_server_alerts(
             session.commit()
 
 
-def delete_inactive_channel(channel_id: int) -> None:
-    """Deletes a given channel from all of the alert tables. This is used to
-    prune channels that were deleted or where bot messages are not allowed."""
+def delete_inactive_channels(channel_ids: set[int]) -> None:
+    """Deletes the given channels from all of the alert tables in one
+    transaction. This is used to prune channels that were deleted or that
+    the bot can no longer access."""
     with Session() as session:
         for table in alert_tables:
-            stmt = delete(table).where(table.channel == channel_id)
+            stmt = delete(table).where(table.channel.in_(channel_ids))
             session.execute(stmt)
-            session.commit()
+        session.commit()
 
 
-async def send_alerts(data_table, alert_table, view=None, alerts=None) -> None:
+def is_permanent_failure(exc: Exception) -> bool:
+    """Unknown Channel and Missing Access will fail on every retry. Anything
+    else, like rate limits or network errors, is treated as transient."""
+    return isinstance(exc, discord.HTTPException) and exc.code in PERMANENT_ERRORS
+
+
+class DeliveryReport:
+    """Collects the delivery failures of one run. Permanently failed channels
+    are skipped for the rest of the run and pruned in one batch, and errors
+    are sent to the exception channel as a single summary."""
+
+    def __init__(self, name: str, prune: bool = True):
+        self.name = name
+        self.prune = prune
+        self.dead_channels = set()
+        self.errors = Counter()
+        self.samples = {}
+
+    def failed(self, channel_id: int, exc: Exception) -> None:
+        key = f"{type(exc).__name__} {getattr(exc, 'code', '')}".strip()
+        self.errors[key] += 1
+        if key not in self.samples:
+            self.samples[key] = "".join(traceback.format_exception(exc))[-500:]
+        if self.prune and is_permanent_failure(exc):
+            self.dead_channels.add(channel_id)
+
+    def is_dead(self, channel_id: int) -> bool:
+        return channel_id in self.dead_channels
+
+    def summary(self) -> str:
+        total = sum(self.errors.values())
+        lines = [
+            f"{self.name}: {total} failed deliveries, "
+            f"{len(self.dead_channels)} channels pruned."
+        ]
+        lines += [f"`{key}`: {count}" for key, count in self.errors.most_common()]
+        key = self.errors.most_common(1)[0][0]
+        lines.append(f"```{self.samples[key]}```")
+        return "\n".join(lines)[-1900:]
+
+    async def finish(self) -> None:
+        if self.dead_channels and not bot.debug_guilds:
+            delete_inactive_channels(self.dead_channels)
+        if self.errors:
+            await report(self.summary())
+
+
+async def send_alerts(data_table, alert_table, view=None, criteria: tuple = ()) -> None:
     """Takes the active alerts in the data table and sends them to the
-    channels in the alert table."""
+    channels in the alert table. Rows are streamed in chunks, optionally
+    narrowed by extra criteria."""
+    startup.first_tick()
     channels = get_alert_channels(alert_table)
-    if alerts == None:
-        alerts = get_unalerted_rows(data_table)
+    report = DeliveryReport(f"Send Alerts ({data_table.__tablename__})")
+    for alerts in get_unalerted_rows(data_table, *criteria):
+        queued = await deliver_alerts(alerts, channels, view, report)
+        update_alert_status(data_table, alerts, queued, report.name)
+    await report.finish()
+
+
+async def deliver_alerts(alerts: list, channels: list[int], view, report) -> list:
+    """Sends the embeds of a chunk of alert rows to every channel. With a
+    delivery queue, returns the (channel, payload) pairs to queue instead."""
+    embeds = []
     for item in alerts:
         if asyncio.iscoroutinefunction(item.alert_embed):
-            embed = await item.alert_embed()
+            embeds.append(await item.alert_embed())
         else:
-            embed = item.alert_embed()
-        for channel_id in channels:
+            embeds.append(item.alert_embed())
+
+    # Views like VoteButton belong to a single item, so those are sent one
+    # message per item. Everything else is packed into as few messages as
+    # the Discord limits allow.
+    if view is None:
+        messages = [{"embeds": embeds} for embeds in pack_embeds(embeds)]
+    else:
+        messages = [{"embed": embed, "view": view} for embed in embeds]
+    if QUEUE_DELIVERIES:
+        payloads = [message_payload(message) for message in messages]
+        return [(channel, payload) for channel in channels for payload in payloads]
+    for channel_id in channels:
+        channel = bot.get_partial_messageable(channel_id)
+        for message in messages:
+            if report.is_dead(channel_id):
+                break
             try:
-                channel = await bot.fetch_channel(channel_id)
-                await channel.send(embed=embed, view=view)
-            except:
-                channel = await bot.fetch_channel(bot.exception_channel)
-                exc_string = f"```{traceback.format_exc()[-1500:]}```"
-                await channel.send(f"Send Alerts Error: {exc_string}")
-                if not bot.debug_guilds:
-                    delete_inactive_channel(channel_id)
-        update_alert_status(data_table, item)
+                await channel.send(**message)
+            except Exception as exc:
+                report.failed(channel_id, exc)
+    return []
+
+
+def message_payload(message: dict) -> dict:
+    """Converts the send() arguments of a message to its Discord API form,
+    which is what the delivery queue stores."""
+    embeds = message.get("embeds") or [message["embed"]]
+    payload = {"embeds": [embed.to_dict() for embed in embeds]}
+    if message.get("view"):
+        payload["components"] = message["view"].to_components()
+    return payload
+
+
+def pack_embeds(embeds: list[discord.Embed]) -> list[list[discord.Embed]]:
+    """Groups embeds into messages of up to 10 embeds and 6000 characters."""
+    messages = []
+    current = []
+    size = 0
+    for embed in embeds:
+        length = len(embed)
+        if current and (
+            len(current) == MAX_EMBEDS_PER_MESSAGE
+            or size + length > MAX_EMBED_CHARS_PER_MESSAGE
+        ):
+            messages.append(current)
+            current = []
+            size = 0
+        current.append(embed)
+        size += length
+    if current:
+        messages.append(current)
+    return messages
 
 
 def get_alert_channels(table) -> list[int]:
     """Returns all channels for a given alert table."""
-    with Session() as session:
+    with read_session() as session:
         stmt = select(getattr(table, "channel")).distinct()
         channels = session.execute(stmt).scalars().all()
     return channels
 
 
-def get_unalerted_rows(table) -> list:
-    """Gets all un-alerted items in the chosen table.
-    This is used to send alerts to channels."""
-    with Session() as session:
-        stmt = select(table).where(getattr(table, "alerted") == False)
-        alerts = session.execute(stmt).scalars().all()
-    return alerts
+def get_unalerted_rows(table, *criteria):
+    """Streams chunks of un-alerted items in the chosen table, projected to
+    the columns their alert embeds need. This is used to send alerts to
+    channels."""
+    criteria = (getattr(table, "alerted") == False, *criteria)
+    yield from stream_records(
+        table, table.alert_columns, *criteria, chunk_size=ALERT_CHUNK_SIZE
+    )
 
 
-def update_alert_status(table, item) -> None:
-    """Changes the alert status to True for a given row.
-    This is used after sending alerts."""
+def update_alert_status(
+    table, items: list, queued: list = None, source: str = None
+) -> None:
+    """Changes the alert status to True for the given rows in one statement.
+    This is used after sending alerts. Queued deliveries of the rows are
+    inserted in the same transaction, so a row is never both queued and
+    still un-alerted."""
+    primary_key = inspect(table).primary_key
+    keys = [tuple(getattr(item, col.name) for col in primary_key) for item in items]
     with Session() as session:
-        stmt = update(table).values(alerted=True).where(table.id == item.id)
-        print(stmt)
+        if queued:
+            session.execute(insert(Deliveries), Deliveries.rows(source, queued))
+        stmt = update(table).values(alerted=True).where(tuple_(*primary_key).in_(keys))
         session.execute(stmt)
         session.commit()
 
 
 async def send_price_alert(alert: PriceAlerts, overviews: dict) -> None:
     embed = PriceInfo.alert_embed(alert, overviews[alert.game_plain])
-    channel = await bot.fetch_channel(alert.channel)
+    channel = bot.get_partial_messageable(alert.channel)
     await channel.send(embed=embed)
 
 
-@tasks.loop(hours=2)
+@profiler.track()
 async def steam_free_release_alert():
     """Gets all free games released since the last run and sends
-    alerts to the free game alerts channels."""
+    alerts to the free game alerts channels. Run by the deadline scheduler."""
 
-    with Session() as session:
-        new_releases = select(SteamFreeGamesCalendar)
-        new_releases = new_releases.where(
-            and_(
-                SteamFreeGamesCalendar.release_date < datetime.now(),
-                SteamFreeGamesCalendar.alerted == False,
-            )
-        )
-        alerts = session.execute(new_releases).scalars().all()
-        await send_alerts(SteamFreeGamesCalendar, FreeToPlayAlerts, alerts=alerts)
+    released = SteamFreeGamesCalendar.release_date < datetime.now()
+    await send_alerts(SteamFreeGamesCalendar, FreeToPlayAlerts, criteria=(released,))
 
 
-@tasks.loop(hours=4)
+@supervised(minutes=15, timeout=600)
+@profiler.track()
 async def price_alert():
+    """Checks the (region, plain) pairs that the poll scheduler marks as due
+    and sends the price alerts whose setpoint was reached. Overviews are
+    fetched in one batched set per region."""
+    startup.first_tick()
     with Session() as session:
-        alerts = session.execute(select(PriceAlerts)).scalars().all()
-    plains = list(set([alert.game_plain for alert in alerts]))
-    overviews = await get_itad_overviews(plains)
-    for item in alerts:
-        if price_comparison(item, overviews):
-            await send_price_alert(item, overviews)
-            await PriceAlerts.delete_alert(item)
-        else:
-            continue
-
-
-@tasks.loop(minutes=30)
+        stmt = select(
+            PriceAlerts.region, PriceAlerts.game_plain, func.max(PriceAlerts.price)
+        )
+        stmt = stmt.group_by(PriceAlerts.region, PriceAlerts.game_plain)
+        thresholds = {(row[0], row[1]): row[2] for row in session.execute(stmt)}
+    poll_scheduler.forget(set(thresholds))
+    due_plains = defaultdict(list)
+    for key in poll_scheduler.due(thresholds):
+        due_plains[key[0]].append(key[1])
+
+    report = DeliveryReport("Price Alerts")
+    for region, plains in due_plains.items():
+        overviews = await get_itad_overviews(plains, region)
+        # Windows are loaded first, so unchanged prices are not stored again.
+        await price_history.preload_async(plains, region)
+        price_history.record_overviews(overviews, region)
+        poll_scheduler.polled(region, overviews, thresholds)
+        await send_price_alerts(region, overviews, report)
+    await report.finish()
+
+
+async def send_price_alerts(region: str, overviews: dict, report) -> None:
+    """Sends and deletes the alerts of a region whose setpoint was reached."""
+    watched = (
+        PriceAlerts.game_plain.in_(list(overviews)),
+        PriceAlerts.region == region,
+    )
+    for alerts in stream_records(PriceAlerts, PriceAlerts.alert_columns, *watched):
+        sent, queued = [], []
+        for item in alerts:
+            if report.is_dead(item.channel) or not price_comparison(item, overviews):
+                continue
+            if QUEUE_DELIVERIES:
+                embed = PriceInfo.alert_embed(item, overviews[item.game_plain])
+                queued.append((item.channel, message_payload({"embed": embed})))
+                sent.append(item.id)
+                continue
+            try:
+                await send_price_alert(item, overviews)
+                sent.append(item.id)
+            except Exception as exc:
+                report.failed(item.channel, exc)
+        if sent:
+            # Queued alerts are deleted in the same transaction that queues
+            # them, so an alert is never both queued and still active.
+            with Session() as session:
+                if queued:
+                    rows = Deliveries.rows(report.name, queued)
+                    session.execute(insert(Deliveries), rows)
+                session.execute(delete(PriceAlerts).where(PriceAlerts.id.in_(sent)))
+                session.commit()
+
+
+@supervised(minutes=30)
+@profiler.track()
 async def gamerpower_alert() -> None:
     await send_alerts(GamerPowerData, GiveawayAlerts)
 
 
-@tasks.loop(minutes=30)
+@supervised(minutes=30)
+@profiler.track()
 async def freetogame_alert() -> None:
     await send_alerts(FreeToGameData, FreeToPlayAlerts)
 
 
-@tasks.loop(minutes=30)
+@supervised(minutes=30)
+@profiler.track()
 async def gamepass_alert() -> None:
     await send_alerts(GamePassData, GamePassAlerts)
 
 
-@tasks.loop(minutes=30)
+@supervised(minutes=30)
+@profiler.track()
 async def local_giveaway_alert() -> None:
     from views import VoteButton
 
     await send_alerts(LocalGiveaways, GiveawayAlerts, view=VoteButton())
 
 
-@tasks.loop(minutes=30)
+@supervised(minutes=30)
+@profiler.track()
 async def update_server_count():
     """Updates the server count in the guild channel and on top.gg"""
 
@@ -219,10 +511,54 @@ async def update_server_count():
         await channel.send(exc_string)
 
 
-@tasks.loop(minutes=30)
+@profiler.track()
+async def steam_sale_start():
+    """Marks the steam sales that have started as alerted and makes the poll
+    scheduler reload the sale windows, so watched prices are polled at the
+    sale interval from its first minute. Run by the deadline scheduler."""
+
+    now = datetime.now()
+    with Session() as session:
+        stmt = (
+            update(UpcomingSteamSales)
+            .where(UpcomingSteamSales.alerted == False)
+            .where(UpcomingSteamSales.start <= now)
+            .values(alerted=True)
+        )
+        session.execute(stmt)
+        session.commit()
+    poll_scheduler.sales_changed()
+
+
+def pick_winners(voter_ids: list[int], count: int) -> list[int]:
+    """Draws one winner per giveaway from a single votes snapshot. Voters are
+    listed once per vote, and nobody wins twice while others are left."""
+    winners = []
+    for _ in range(count):
+        remaining = [voter for voter in voter_ids if voter not in winners]
+        winners.append(random.choice(remaining or voter_ids))
+    return winners
+
+
+async def send_giveaway_key(giveaway: LocalGiveaways, winner: int) -> None:
+    user = await bot.get_or_fetch_user(winner)
+    message = (
+        "Thanks for voting! You've won our giveaway!\n" f"Steam key: {giveaway.key}"
+    )
+    await user.send(message, embed=await giveaway.alert_embed())
+
+
+def retry_giveaway(giveaway: LocalGiveaways) -> None:
+    """Schedules another draw for a giveaway that could not be resolved."""
+    retry = datetime.now() + GIVEAWAY_RETRY
+    deadlines.schedule("local_giveaway_end", giveaway.id, retry)
+
+
+@profiler.track()
 async def update_local_giveaways():
-    """Assigns a winner to giveaways that have ended. Sends the winner a
-    DM with the steam key and updates the entry in the database."""
+    """Assigns winners to all giveaways that have ended. The winners are sent
+    a DM with the steam key concurrently and all assignments are written in
+    one bulk update. Run by the deadline scheduler."""
 
     with Session() as session:
         stmt = select(LocalGiveaways).where(
@@ -230,26 +566,77 @@ async def update_local_giveaways():
                 LocalGiveaways.end_time <= datetime.now(), LocalGiveaways.winner == None
             )
         )
-        giveaway = session.execute(stmt).scalars().all()
-        giveaway = giveaway[0]
-    votes = await bot.topggpy.get_bot_votes()
-    voter_ids = [voter["id"] for voter in votes]
-    winner = random.choice(voter_ids)
-    try:
-        user = await bot.get_or_fetch_user(winner)
-        message = (
-            "Thanks for voting! You've won our giveaway!\n" f"Steam key: {giveaway.key}"
-        )
-        await user.send(message, embed=await giveaway.alert_embed())
+        giveaways = session.execute(stmt).scalars().all()
+    voter_ids = vote_ledger.voters()
+    if not voter_ids:
+        # Nobody voted yet this month, or the ledger is still loading.
+        for giveaway in giveaways:
+            retry_giveaway(giveaway)
+        return
+    if not giveaways:
+        return
+    winners = pick_winners(voter_ids, len(giveaways))
+    results = await asyncio.gather(
+        *[send_giveaway_key(giveaway, winner) for giveaway, winner in zip(giveaways, winners)],
+        return_exceptions=True,
+    )
+
+    assignments = []
+    report = DeliveryReport("Giveaway winners", prune=False)
+    for giveaway, winner, result in zip(giveaways, winners, results):
+        if isinstance(result, Exception):
+            report.failed(winner, result)
+            retry_giveaway(giveaway)
+        else:
+            assignments.append({"id": giveaway.id, "winner": winner})
+    if assignments:
         with Session() as session:
-            stmt = (
-                update(LocalGiveaways)
-                .where(LocalGiveaways.id == giveaway.id)
-                .values(winner=winner)
-            )
-            session.execute(stmt)
+            session.bulk_update_mappings(LocalGiveaways, assignments)
             session.commit()
-    except:
-        channel = await bot.fetch_channel(bot.exception_channel)
-        exc_string = f"```{traceback.format_exc()[-1500:]}```"
-        await channel.send(f"Giveaway error:\n{exc_string}")
+    await report.finish()
+
+
+def pending_deadlines(key, column, condition) -> list[tuple]:
+    """Gets the (key, deadline) pairs of rows that are still pending."""
+    with Session() as session:
+        return session.execute(select(key, column).where(condition)).all()
+
+
+def pending_version(column, condition) -> tuple:
+    """Cheap fingerprint of the pending rows, used to skip unchanged reloads."""
+    with Session() as session:
+        stmt = select(func.count(), func.max(column)).where(condition)
+        return tuple(session.execute(stmt).one())
+
+
+def register_deadline(kind: str, handler, key, column, condition) -> None:
+    deadlines.register(
+        kind,
+        handler,
+        loader=lambda: pending_deadlines(key, column, condition),
+        version=lambda: pending_version(column, condition),
+    )
+
+
+deadlines = DeadlineScheduler()
+register_deadline(
+    "steam_free_release",
+    steam_free_release_alert,
+    SteamFreeGamesCalendar.id,
+    SteamFreeGamesCalendar.release_date,
+    SteamFreeGamesCalendar.alerted == False,
+)
+register_deadline(
+    "local_giveaway_end",
+    update_local_giveaways,
+    LocalGiveaways.id,
+    LocalGiveaways.end_time,
+    LocalGiveaways.winner == None,
+)
+register_deadline(
+    "steam_sale_start",
+    steam_sale_start,
+    UpcomingSteamSales.title,
+    UpcomingSteamSales.start,
+    UpcomingSteamSales.alerted == False,
+)
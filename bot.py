@@ -10,14 +10,34 @@ else:
     DEBUG_GUILD = None
     SUPPORT_SERVER = [os.getenv("SUPPORT_SERVER")]
 
-intents = discord.Intents.default()
-bot = discord.Bot(debug_guilds=DEBUG_GUILD, intents=intents)
+# The low memory profile keeps only the guild state that slash commands need,
+# without message, member or presence caches.
+LOW_MEMORY = os.getenv("LOW_MEMORY") == "1"
+if LOW_MEMORY:
+    intents = discord.Intents.none()
+    intents.guilds = True
+    client_options = {
+        "max_messages": None,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": False,
+    }
+else:
+    intents = discord.Intents.default()
+    client_options = {}
+bot = discord.Bot(debug_guilds=DEBUG_GUILD, intents=intents, **client_options)
 bot.support_server = SUPPORT_SERVER
 bot.stream_channel = os.getenv("DISCORD_STREAMING_CHANNEL")
 bot.exception_channel = os.getenv("DISCORD_EXCEPTION_CHANNEL")
+bot.profile_channel = os.getenv("DISCORD_PROFILE_CHANNEL", bot.exception_channel)
 bot.vote_channel = os.getenv("DISCORD_VOTE_CHANNEL")
 bot.server_count_channel = os.getenv("DISCORD_SERVER_COUNT_CHANNEL")
-if not bot.debug_guilds:
+
+
+def setup_topgg() -> None:
+    """Creates the top.gg client and starts the vote webhook server.
+    Called by the application factory instead of at import time."""
+    if bot.debug_guilds or hasattr(bot, "topggpy"):
+        return
     bot.topggpy = topgg.DBLClient(bot, os.getenv("TOPGG_TOKEN"))
     bot.topgg_webhook = topgg.WebhookManager(bot).dbl_webhook(
         "/dblwebhook", os.getenv("TOPGG_AUTH")
@@ -0,0 +1,132 @@
+import asyncio
+import multiprocessing
+import sys
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete
+
+import models
+from models import Session, Deliveries
+from bot import bot, DISCORD_TOKEN
+from alerts import DeliveryReport, is_permanent_failure
+
+# Deliveries claimed per batch.
+BATCH_SIZE = 20
+# A claim leases deliveries for this long. Deliveries of a worker that dies
+# mid-batch become available to the other workers when the lease ends.
+CLAIM_LEASE = timedelta(minutes=5)
+IDLE_SLEEP = 5
+MAX_ATTEMPTS = 5
+RETRY_DELAY = timedelta(seconds=30)
+# Seconds between failure summaries sent to the exception channel.
+REPORT_INTERVAL = 300
+
+
+async def send_payload(channel_id: int, payload: dict) -> None:
+    await bot.http.send_message(
+        channel_id,
+        None,
+        embeds=payload.get("embeds"),
+        components=payload.get("components"),
+    )
+
+
+def claim_batch(batch_size: int = BATCH_SIZE) -> list[Deliveries]:
+    """Claims due deliveries with FOR UPDATE SKIP LOCKED and leases them by
+    moving available_at past the lease, in one short transaction. No row
+    locks are held while the claimed deliveries are sent."""
+    now = datetime.now()
+    with Session(expire_on_commit=False) as session:
+        stmt = (
+            select(Deliveries)
+            .where(Deliveries.available_at <= now)
+            .order_by(Deliveries.available_at, Deliveries.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        deliveries = session.execute(stmt).scalars().all()
+        for delivery in deliveries:
+            delivery.available_at = now + CLAIM_LEASE
+        session.commit()
+    return deliveries
+
+
+async def process_batch(report: DeliveryReport, batch_size: int = BATCH_SIZE) -> int:
+    """Claims a batch of due deliveries and sends them. Sent and permanently
+    failed deliveries are deleted, transient failures are retried later with
+    backoff. Returns the claimed count."""
+    deliveries = claim_batch(batch_size)
+    finished, retries = [], []
+    for delivery in deliveries:
+        if report.is_dead(delivery.channel):
+            finished.append(delivery.id)
+            continue
+        try:
+            await send_payload(delivery.channel, delivery.payload)
+            finished.append(delivery.id)
+        except Exception as exc:
+            report.failed(delivery.channel, exc)
+            attempts = delivery.attempts + 1
+            if is_permanent_failure(exc) or attempts >= MAX_ATTEMPTS:
+                finished.append(delivery.id)
+            else:
+                retry_at = datetime.now() + RETRY_DELAY * 2**attempts
+                retries.append(
+                    {"id": delivery.id, "attempts": attempts, "available_at": retry_at}
+                )
+    with Session() as session:
+        if finished:
+            session.execute(delete(Deliveries).where(Deliveries.id.in_(finished)))
+        if retries:
+            session.bulk_update_mappings(Deliveries, retries)
+        session.commit()
+    return len(deliveries)
+
+
+async def run_worker(batch_size: int = BATCH_SIZE) -> None:
+    """Logs in over REST only, without a gateway connection, and drains the
+    delivery queue until stopped."""
+    models.init_db()
+    await bot.login(DISCORD_TOKEN)
+    report = DeliveryReport("Delivery Worker")
+    reported = time.monotonic()
+    try:
+        while True:
+            try:
+                claimed = await process_batch(report, batch_size)
+            except Exception:
+                traceback.print_exc()
+                claimed = 0
+            if time.monotonic() - reported > REPORT_INTERVAL:
+                try:
+                    await report.finish()
+                    if report.dead_channels and not bot.debug_guilds:
+                        Deliveries.discard(report.dead_channels)
+                except Exception:
+                    traceback.print_exc()
+                report = DeliveryReport("Delivery Worker")
+                reported = time.monotonic()
+            if claimed < batch_size:
+                await asyncio.sleep(IDLE_SLEEP)
+    finally:
+        await bot.http.close()
+
+
+def start_worker() -> None:
+    # The client's HTTP state is bound to bot.loop, like in bot.run().
+    bot.loop.run_until_complete(run_worker())
+
+
+if __name__ == "__main__":
+    # Usage: python delivery_worker.py [processes]
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    workers = [
+        multiprocessing.Process(target=start_worker, name=f"delivery-{i}")
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
@@ -0,0 +1,42 @@
+import os
+import traceback
+
+from bot import bot
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def repo_site(frames, skip: tuple = ()) -> str:
+    """Names the first frame of this repository, as "file:line function".
+
+    Frames are (filename, lineno, function) triples, innermost first. Files
+    in skip are passed over, so helpers do not report themselves. Returns
+    None when no frame belongs to the repository."""
+    for filename, lineno, name in frames:
+        if filename.startswith(REPO_DIR) and filename not in skip:
+            return f"{os.path.relpath(filename, REPO_DIR)}:{lineno} {name}"
+    return None
+
+
+def exception_block(exc: Exception = None, limit: int = 1500) -> str:
+    """The end of a traceback as a code block, of exc or the handled one."""
+    if exc is None:
+        details = traceback.format_exc()
+    else:
+        details = "".join(traceback.format_exception(exc))
+    return f"```{details[-limit:]}```"
+
+
+async def report(message: str) -> None:
+    """Sends a message to the exception channel. Failures to send are only
+    printed, so reporting never raises into the failing code."""
+    try:
+        channel = await bot.fetch_channel(bot.exception_channel)
+        await channel.send(message[:2000])
+    except Exception:
+        traceback.print_exc()
+
+
+async def report_exception(title: str, exc: Exception = None) -> None:
+    """Sends a titled traceback to the exception channel."""
+    await report(f"{title}:\n{exception_block(exc)}")
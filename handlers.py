@@ -0,0 +1,22 @@
+# Stateless handlers of components and modals, keyed by the custom_id prefix.
+# The rest of the custom_id, after the first colon, is passed as the argument.
+# They live apart from interactions.py, so running that module as a script
+# still registers every handler in this one registry.
+component_handlers = {}
+
+
+def component_handler(name: str):
+    def wrapper(func):
+        component_handlers[name] = func
+        return func
+
+    return wrapper
+
+
+async def dispatch_component(interaction, custom_id: str) -> bool:
+    """Runs the handler of a custom_id. Returns whether one was registered."""
+    name, _, argument = custom_id.partition(":")
+    if name not in component_handlers:
+        return False
+    await component_handlers[name](interaction, argument)
+    return True
@@ -0,0 +1,226 @@
+import asyncio
+import csv
+import os
+import sys
+import tempfile
+
+
+import models
+from metrics import metrics
+from models import (
+    GamerPowerData,
+    FreeToGameData,
+    GamePassData,
+    G2AData,
+    SteamApps,
+)
+from price import api_call, api_stream
+from supervisor import supervised
+
+GAMEPASS_SIGL = os.getenv("GAMEPASS_SIGL", "fdd9e2a7-0fee-49f6-ad69-4354098401ff")
+G2A_AUTH = f"{os.getenv('G2A_CLIENT_ID')}, {os.getenv('G2A_API_KEY')}"
+
+
+async def fetch_gamerpower():
+    async for giveaway in api_stream("https://www.gamerpower.com/api/giveaways"):
+        yield giveaway
+
+
+async def fetch_free_to_game():
+    async for game in api_stream("https://www.freetogame.com/api/games"):
+        yield game
+
+
+async def fetch_gamepass():
+    url = "https://catalog.gamepass.com/sigls/v2"
+    params = {"id": GAMEPASS_SIGL, "language": "en-us", "market": "US"}
+    ids = [item["id"] async for item in api_stream(url, params=params) if "id" in item]
+    url = "https://displaycatalog.mp.microsoft.com/v7.0/products"
+    for i in range(0, len(ids), 20):
+        params = {"bigIds": ",".join(ids[i : i + 20]), "market": "US", "languages": "en-us"}
+        async for product in api_stream(url, "Products", params):
+            props = product["LocalizedProperties"][0]
+            images = {image["ImagePurpose"]: image["Uri"] for image in props["Images"]}
+            image = images.get("SuperHeroArt") or images.get("BoxArt") or ""
+            yield {
+                "id": product["ProductId"],
+                "title": props["ProductTitle"],
+                "description": props["ShortDescription"],
+                "image_url": f"https:{image}" if image.startswith("//") else image,
+                "developer": props["DeveloperName"],
+                "publisher": props["PublisherName"],
+                "category": (product.get("Properties") or {}).get("Category"),
+                "url": f"https://www.xbox.com/en-US/games/store/p/{product['ProductId']}",
+                "status": "active",
+            }
+
+
+async def fetch_g2a():
+    # Pages hold 20 products, and the total is needed to stop, so each page
+    # is loaded whole.
+    url = "https://api.g2a.com/v1/products"
+    page = 1
+    while True:
+        result = await api_call(url, {"page": page}, headers={"Authorization": G2A_AUTH})
+        for product in result.get("docs", []):
+            yield {
+                "g2a_id": product["id"],
+                "title": product["name"],
+                "slug": product["slug"],
+                "minprice": product["minPrice"],
+                "region": product.get("region"),
+                "platform": product.get("platform"),
+            }
+        if not result.get("docs") or page * 20 >= result.get("total", 0):
+            break
+        page += 1
+
+
+async def fetch_steam_apps():
+    url = "https://api.steampowered.com/ISteamApps/GetAppList/v2/"
+    async for app in api_stream(url, "apps"):
+        if app["name"]:
+            yield app
+
+
+class Source:
+    """An upstream catalog, the table it is stored in and the column that
+    identifies a row. Tables with an alerted column get new rows marked as
+    un-alerted, which the matching alert loop then sends."""
+
+    def __init__(self, name: str, table, key: str, fetch, alert=None):
+        self.name = name
+        self.table = table
+        self.key = key
+        self.fetch = fetch
+        self.alert = alert
+        self.columns = [
+            column.name
+            for column in table.__table__.columns
+            if column.name != "alerted" and not (column.primary_key and column.name != key)
+        ]
+        self.alerted = "alerted" in table.__table__.columns
+
+
+def ensure_key_index(cursor, source: Source) -> None:
+    """Creates the unique index that the upsert's ON CONFLICT needs when the
+    key is not the primary key, for tables created before the key was
+    unique. Duplicate keys are dropped first, keeping one row per key."""
+    if source.table.__table__.columns[source.key].primary_key:
+        return
+    table = source.table.__tablename__
+    index = f"{table}_{source.key}_key"
+    cursor.execute("SELECT to_regclass(%s)", (index,))
+    if cursor.fetchone()[0] is not None:
+        return
+    cursor.execute(
+        f"DELETE FROM {table} a USING {table} b "
+        f'WHERE a."{source.key}" = b."{source.key}" AND a.ctid < b.ctid'
+    )
+    cursor.execute(
+        f'CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {table} ("{source.key}")'
+    )
+
+
+def apply_rows(source: Source, buffer, first_load: bool) -> list:
+    """Copies the buffered CSV rows into a staging table and upserts them in
+    one transaction. Unchanged rows are not rewritten. Returns the keys of
+    the rows that were inserted."""
+    table = source.table.__tablename__
+    columns = ", ".join(f'"{column}"' for column in source.columns)
+    updates = [f'"{c}" = EXCLUDED."{c}"' for c in source.columns if c != source.key]
+    current = ", ".join(f'{table}."{c}"' for c in source.columns if c != source.key)
+    excluded = ", ".join(f'EXCLUDED."{c}"' for c in source.columns if c != source.key)
+    insert_columns, select_columns = columns, columns
+    if source.alerted:
+        insert_columns += ", alerted"
+        select_columns += f", {'true' if first_load else 'false'}"
+
+    with models.engine.begin() as conn:
+        cursor = conn.connection.cursor()
+        ensure_key_index(cursor, source)
+        cursor.execute(
+            f"CREATE TEMP TABLE staging ON COMMIT DROP AS "
+            f"SELECT {columns} FROM {table} WITH NO DATA"
+        )
+        cursor.copy_expert(f"COPY staging ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.execute(
+            f"INSERT INTO {table} ({insert_columns}) "
+            f'SELECT DISTINCT ON ("{source.key}") {select_columns} FROM staging '
+            f'ORDER BY "{source.key}" '
+            f'ON CONFLICT ("{source.key}") DO UPDATE SET {", ".join(updates)} '
+            f"WHERE ({current}) IS DISTINCT FROM ({excluded}) "
+            f'RETURNING "{source.key}", (xmax = 0) AS inserted'
+        )
+        return [key for key, inserted in cursor.fetchall() if inserted]
+
+
+def is_empty(source: Source) -> bool:
+    """Whether the table of a source has no rows yet, as on the first load."""
+    table = source.table.__tablename__
+    with models.engine.connect() as conn:
+        stmt = f"SELECT EXISTS (SELECT 1 FROM {table})"
+        return not conn.exec_driver_sql(stmt).scalar()
+
+
+async def ingest(source: Source) -> list:
+    """Streams a source into a CSV spool file, applies it with one COPY and
+    upsert, and triggers the alert loop when new rows arrived."""
+    first_load = await asyncio.to_thread(is_empty, source)
+    with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024, mode="w+") as buffer:
+        writer = csv.writer(buffer)
+        async for row in source.fetch():
+            writer.writerow([row.get(column) for column in source.columns])
+        buffer.seek(0)
+        new_keys = await asyncio.to_thread(apply_rows, source, buffer, first_load)
+    metrics.inc(f"ingest.{source.name}.runs")
+    metrics.inc(f"ingest.{source.name}.new_rows", len(new_keys))
+    if new_keys and source.alert and not first_load:
+        await source.alert()
+    return new_keys
+
+
+def create_sources(with_alerts: bool = True) -> dict[str, Source]:
+    """Creates the sources. Without alerts, new rows are left for the bot's
+    alert loops to pick up, which is what the command line entry point does."""
+    if with_alerts:
+        from alerts import gamerpower_alert, freetogame_alert, gamepass_alert
+    else:
+        gamerpower_alert = freetogame_alert = gamepass_alert = None
+
+    sources = [
+        Source("gamerpower", GamerPowerData, "id", fetch_gamerpower, gamerpower_alert),
+        Source("free_to_game", FreeToGameData, "id", fetch_free_to_game, freetogame_alert),
+        Source("gamepass", GamePassData, "id", fetch_gamepass, gamepass_alert),
+        Source("g2a", G2AData, "g2a_id", fetch_g2a),
+        Source("steam_apps", SteamApps, "appid", fetch_steam_apps),
+    ]
+    return {source.name: source for source in sources}
+
+
+@supervised(minutes=30)
+async def ingest_alert_sources():
+    """Refreshes the small catalogs that feed the alert loops."""
+    sources = create_sources()
+    for name in ["gamerpower", "free_to_game", "gamepass"]:
+        await ingest(sources[name])
+
+
+@supervised(hours=24)
+async def ingest_catalogs():
+    """Refreshes the large g2a and steam_apps catalogs."""
+    sources = create_sources()
+    for name in ["g2a", "steam_apps"]:
+        await ingest(sources[name])
+
+
+async def main(names: list[str]) -> None:
+    models.init_db()
+    sources = create_sources(with_alerts=False)
+    for name in names or sources:
+        new_keys = await ingest(sources[name])
+        print(f"Ingested {name}: {len(new_keys)} new rows")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
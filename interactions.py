@@ -0,0 +1,243 @@
+import asyncio
+import importlib
+import json
+import os
+import time
+
+import discord
+from aiohttp import web
+from discord import utils
+from discord.webhook.async_ import AsyncWebhookAdapter, async_context
+
+from bot import bot, DISCORD_TOKEN
+from diagnostics import report_exception
+from handlers import dispatch_component
+from votes import vote_ledger
+
+DISCORD_PUBLIC_KEY = os.getenv("DISCORD_PUBLIC_KEY")
+INTERACTIONS_PORT = int(os.getenv("INTERACTIONS_PORT", 8080))
+# Discord fails an interaction that is not answered within 3 seconds.
+RESPONSE_DEADLINE = 2.5
+GUILD_TTL = 3600
+
+PING = 1
+APPLICATION_COMMAND = 2
+MESSAGE_COMPONENT = 3
+AUTOCOMPLETE = 4
+MODAL_SUBMIT = 5
+
+# Interaction response types.
+CHANNEL_MESSAGE = 4
+DEFERRED_CHANNEL_MESSAGE = 5
+DEFERRED_UPDATE_MESSAGE = 6
+UPDATE_MESSAGE = 7
+AUTOCOMPLETE_RESULT = 8
+
+
+def deferred_response(data: dict) -> dict:
+    """Acknowledges an interaction whose handler is still running when the
+    response deadline passes. Components defer as an update of their
+    message, commands and modals as a message that is filled in later.
+    Autocomplete cannot be deferred and gets no choices."""
+    if data["type"] == MESSAGE_COMPONENT:
+        return {"type": DEFERRED_UPDATE_MESSAGE}
+    if data["type"] == AUTOCOMPLETE:
+        return {"type": AUTOCOMPLETE_RESULT, "data": {"choices": []}}
+    return {"type": DEFERRED_CHANNEL_MESSAGE}
+
+
+def message_form(data: dict, files: list) -> dict:
+    """Request arguments of a webhook message, as multipart with files."""
+    if not files:
+        return {"payload": data}
+    data = {**data, "attachments": []}
+    form = [{"name": "payload_json"}]
+    for index, file in enumerate(files):
+        data["attachments"].append(
+            {"id": index, "filename": file.filename, "description": file.description}
+        )
+        form.append(
+            {
+                "name": f"files[{index}]",
+                "value": file.fp,
+                "filename": file.filename,
+                "content_type": "application/octet-stream",
+            }
+        )
+    form[0]["value"] = utils._to_json(data)
+    return {"multipart": form, "files": files}
+
+
+class EndpointAdapter(AsyncWebhookAdapter):
+    """Returns the first response of an interaction as the body of the HTTP
+    request it arrived with, instead of a separate callback request. The
+    handler only continues once the body was written, so followups can never
+    overtake the initial response.
+
+    When the body had to be a deferral, because the handler missed the
+    deadline or the response carries files, the handler's response is sent
+    afterwards by editing the original response or as a followup."""
+
+    def __init__(self):
+        super().__init__()
+        self.pending = {}
+        self.deferred = {}
+
+    async def create_interaction_response(
+        self, interaction_id, token, *, session, type, data=None, files=None, **kwargs
+    ):
+        interaction_id = int(interaction_id)
+        pending = self.pending.pop(interaction_id, None)
+        if pending is not None:
+            response, written = pending
+            if files and type in (CHANNEL_MESSAGE, UPDATE_MESSAGE):
+                deferral = {CHANNEL_MESSAGE: DEFERRED_CHANNEL_MESSAGE}
+                deferral = deferral.get(type, DEFERRED_UPDATE_MESSAGE)
+                self.deferred[interaction_id] = deferral
+                response.set_result({"type": deferral})
+            else:
+                response.set_result(
+                    {"type": type, "data": data} if data else {"type": type}
+                )
+            await asyncio.wait_for(written.wait(), RESPONSE_DEADLINE)
+        if interaction_id not in self.deferred:
+            return
+        deferral = self.deferred.pop(interaction_id)
+        application_id = bot._connection.application_id
+        form = message_form(data or {}, files)
+        if type == CHANNEL_MESSAGE and deferral == DEFERRED_UPDATE_MESSAGE:
+            await self.execute_webhook(
+                application_id, token, session=session, **form, **kwargs
+            )
+        elif type in (CHANNEL_MESSAGE, UPDATE_MESSAGE):
+            # Edits cannot change flags like ephemeral, the deferral set them.
+            form.get("payload", {}).pop("flags", None)
+            await self.edit_original_interaction_response(
+                application_id, token, session=session, **form, **kwargs
+            )
+        # Deferrals were already sent, and a modal or autocomplete choices can
+        # no longer be shown once the deadline passed.
+
+
+endpoint_adapter = EndpointAdapter()
+_guilds_loaded = {}
+
+
+def verify(body: bytes, signature: str, timestamp: str, public_key: str = None) -> bool:
+    from nacl.exceptions import BadSignatureError
+    from nacl.signing import VerifyKey
+
+    try:
+        key = VerifyKey(bytes.fromhex(public_key or DISCORD_PUBLIC_KEY))
+        key.verify(timestamp.encode() + body, bytes.fromhex(signature))
+        return True
+    except (BadSignatureError, ValueError, TypeError):
+        return False
+
+
+async def load_guild(guild_id) -> None:
+    """Caches a guild fetched over REST, since there is no gateway to fill
+    the cache. Handlers read the guild id and name from it."""
+    if guild_id is None:
+        return
+    guild_id = int(guild_id)
+    if time.monotonic() - _guilds_loaded.get(guild_id, -GUILD_TTL) < GUILD_TTL:
+        return
+    guild = await bot.fetch_guild(guild_id)
+    bot._connection._add_guild(guild)
+    _guilds_loaded[guild_id] = time.monotonic()
+
+
+async def dispatch(data: dict) -> None:
+    """Runs the handler of an interaction. Commands and autocomplete go
+    through the registered application commands, components and modals
+    through the stateless handlers."""
+    async_context.set(endpoint_adapter)
+    await load_guild(data.get("guild_id"))
+    interaction = discord.Interaction(data=data, state=bot._connection)
+    if data["type"] in (APPLICATION_COMMAND, AUTOCOMPLETE):
+        await bot.process_application_commands(interaction)
+    elif data["type"] in (MESSAGE_COMPONENT, MODAL_SUBMIT):
+        await dispatch_component(interaction, data["data"]["custom_id"])
+
+
+async def handle_interaction(request: web.Request) -> web.StreamResponse:
+    body = await request.read()
+    signature = request.headers.get("X-Signature-Ed25519", "")
+    timestamp = request.headers.get("X-Signature-Timestamp", "")
+    if not verify(body, signature, timestamp):
+        return web.Response(status=401, text="invalid request signature")
+    data = json.loads(body)
+    if data["type"] == PING:
+        return web.json_response({"type": PING})
+
+    interaction_id = int(data["id"])
+    response = asyncio.get_running_loop().create_future()
+    written = asyncio.Event()
+    endpoint_adapter.pending[interaction_id] = (response, written)
+    task = asyncio.create_task(dispatch(data))
+    task.add_done_callback(report_failure)
+    await asyncio.wait(
+        [response, task], timeout=RESPONSE_DEADLINE, return_when=asyncio.FIRST_COMPLETED
+    )
+    endpoint_adapter.pending.pop(interaction_id, None)
+    if not response.done():
+        # The handler is still running, or ended without responding.
+        if not task.done():
+            endpoint_adapter.deferred[interaction_id] = deferred_response(data)["type"]
+        return web.json_response(deferred_response(data))
+    stream = web.json_response(response.result())
+    await stream.prepare(request)
+    await stream.write_eof()
+    written.set()
+    return stream
+
+
+def report_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        asyncio.create_task(
+            report_exception("Interaction endpoint error", task.exception())
+        )
+
+
+async def load_command_ids() -> None:
+    """Maps the registered command ids to the local commands. The gateway
+    bot syncs the commands, handler processes only look them up."""
+    registered = await bot.http.get_global_commands(bot.user.id)
+    for guild_id in set(bot.support_server or []) - {None}:
+        registered += await bot.http.get_guild_commands(bot.user.id, int(guild_id))
+    local = {command.name: command for command in bot.pending_application_commands}
+    for data in registered:
+        command = local.get(data["name"])
+        if command is not None:
+            command.id = data["id"]
+            bot._application_commands[data["id"]] = command
+
+
+async def serve(port: int = INTERACTIONS_PORT) -> None:
+    """Runs a stateless handler process: REST login, no gateway connection,
+    and an HTTP endpoint for the signed interactions."""
+    if not DISCORD_PUBLIC_KEY:
+        raise RuntimeError("DISCORD_PUBLIC_KEY is required to verify interactions")
+    await bot.login(DISCORD_TOKEN)
+    bot._connection.application_id = bot.user.id
+    await load_command_ids()
+    # Votes arrive through the gateway process's webhook, the ledger here
+    # follows the votes table.
+    await vote_ledger.load(follow=True)
+    app = web.Application()
+    app.router.add_post("/interactions", handle_interaction)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, port=port).start()
+    print(f"Interactions endpoint listening on port {port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    from main import create_app
+
+    create_app(check_schema=False, webhooks=False)
+    # Importing views registers its component handlers in handlers.py.
+    importlib.import_module("views")
+    bot.loop.run_until_complete(serve())
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+from diagnostics import report, repo_site
+from metrics import metrics
+
+
+def blocking_site(stack: traceback.StackSummary) -> str:
+    """The innermost frame of this repository in a stack, or the innermost
+    frame when the loop is blocked outside of it."""
+    frames = ((frame.filename, frame.lineno, frame.name) for frame in reversed(stack))
+    site = repo_site(frames, skip=(__file__,))
+    if site is not None:
+        return site
+    frame = stack[-1]
+    return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+
+
+class LoopWatchdog:
+    """Measures event loop lag and finds the code that blocks the loop.
+
+    A coroutine wakes up on a short interval and records how late it was.
+    A separate thread checks that the coroutine keeps ticking. When the loop
+    has been stuck past the threshold it captures the stack of the loop
+    thread, so the time is attributed to the code that was actually running.
+    Offenders are aggregated and sent to the exception channel periodically."""
+
+    def __init__(
+        self, interval: float = 0.1, threshold: float = 0.25, report_minutes: int = 15
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.report_interval = report_minutes * 60
+        self.last_tick = time.monotonic()
+        self.offenders = Counter()
+        self.longest = {}
+        self.samples = {}
+        self._loop_thread = None
+        self._stall = None
+        self._lock = threading.Lock()
+        self._tasks = []
+
+    async def _tick(self) -> None:
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.last_tick = time.monotonic()
+            lag = self.last_tick - start - self.interval
+            metrics.observe("loop.lag", lag)
+            metrics.gauge("loop.lag_last", lag)
+
+    def _watch(self) -> None:
+        """Runs in its own thread, since the loop cannot watch itself."""
+        while True:
+            time.sleep(self.interval)
+            last_tick = self.last_tick
+            stalled = time.monotonic() - last_tick
+            if stalled < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            with self._lock:
+                if self._stall is None or self._stall[0] != last_tick:
+                    stack = traceback.extract_stack(frame)
+                    site = blocking_site(stack)
+                    self._stall = (last_tick, site)
+                    self.offenders[site] += 1
+                    self.samples[site] = "".join(stack.format()[-6:])
+                    metrics.inc("loop.blocked")
+                site = self._stall[1]
+                self.longest[site] = max(self.longest.get(site, 0), stalled)
+
+    def summary(self, limit: int = 5) -> str:
+        lines = ["Event loop blocked (count | longest | site):"]
+        for site, count in self.offenders.most_common(limit):
+            lines.append(f"{count} | {self.longest[site]:.2f}s | {site}")
+        site = self.offenders.most_common(1)[0][0]
+        lines.append(f"```{self.samples[site][-1200:]}```")
+        return "\n".join(lines)
+
+    async def _report(self) -> None:
+        while True:
+            await asyncio.sleep(self.report_interval)
+            with self._lock:
+                if not self.offenders:
+                    continue
+                summary = self.summary()
+                self.offenders.clear()
+                self.longest.clear()
+                self.samples.clear()
+            await report(summary[:1900])
+
+    def start(self) -> None:
+        """Starts the watchdog on the running loop. Safe to call again."""
+        if self._tasks:
+            return
+        self._loop_thread = threading.get_ident()
+        self.last_tick = time.monotonic()
+        self._tasks = [
+            asyncio.create_task(self._tick()),
+            asyncio.create_task(self._report()),
+        ]
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+
+loop_monitor = LoopWatchdog(
+    threshold=float(os.getenv("LOOP_BLOCK_THRESHOLD", 0.25)),
+)
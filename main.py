@@ -1,12 +1,18 @@
+import startup
 import discord
+import os
 from discord.commands import option
 from discord.ext import commands
 from datetime import datetime
 from discord.ext import pages
 
 from wrappers import command_streaming
-from price import game_autocomplete_options, price_lookup_response
-from bot import bot, DISCORD_TOKEN
+from price import (
+    game_autocomplete_options,
+    price_lookup_response,
+    compare_prices_response,
+)
+from bot import bot, DISCORD_TOKEN, setup_topgg
 from alerts import (
     freetogame_alert,
     gamerpower_alert,
@@ -15,9 +21,8 @@ from alerts import (
     price_alert,
     update_server_count,
     local_giveaway_alert,
-    steam_free_release_alert,
-    update_local_giveaways,
     alert_check,
+    deadlines,
 )
 from models import (
     GiveawayAlerts,
@@ -27,7 +32,21 @@ from models import (
     Logs,
     LocalGiveaways,
     UpcomingSteamSales,
+    ServerSettings,
+    REGIONS,
+    format_price,
+    init_db,
 )
+import models
+from query_profiler import profiler
+from votes import vote_ledger
+from metrics import metrics
+from supervisor import tasks_status, supervised_tasks
+from run_profiler import run_profiler, MODES
+from loop_monitor import loop_monitor
+from memory import memory_report
+from ingest import ingest_alert_sources, ingest_catalogs
+from diagnostics import report_exception
 
 alert_tasks = [
     freetogame_alert,
@@ -36,15 +55,26 @@ alert_tasks = [
     price_alert,
     update_server_count,
     local_giveaway_alert,
-    steam_free_release_alert,
-    update_local_giveaways,
 ]
+if os.getenv("INGEST") == "1":
+    alert_tasks += [ingest_alert_sources, ingest_catalogs]
 
 
 @bot.event
 async def on_ready():
+    startup.mark("gateway_ready")
+    if os.getenv("LOOP_MONITOR", "1") == "1":
+        loop_monitor.start()
     for task in alert_tasks:
         task.start()
+    deadlines.start()
+    # on_ready runs again after reconnects, the ledger only loads until it
+    # succeeded once. Webhook votes are still recorded while top.gg is down.
+    if not vote_ledger.loaded:
+        try:
+            await vote_ledger.load()
+        except Exception:
+            await report_exception("Vote ledger load failed")
 
 
 create = discord.SlashCommandGroup("create", "Alert creation commands")
@@ -101,6 +131,59 @@ async def price_alert(ctx: discord.ApplicationContext, game_name):
     await price_lookup_response(ctx, game_name)
 
 
+@bot.slash_command()
+@discord.option(
+    name="game_1", autocomplete=game_autocomplete_options, description="First game."
+)
+@discord.option(
+    name="game_2", autocomplete=game_autocomplete_options, description="Second game."
+)
+@discord.option(
+    name="game_3",
+    autocomplete=game_autocomplete_options,
+    description="Third game.",
+    required=False,
+)
+@discord.option(
+    name="game_4",
+    autocomplete=game_autocomplete_options,
+    description="Fourth game.",
+    required=False,
+)
+@discord.option(
+    name="game_5",
+    autocomplete=game_autocomplete_options,
+    description="Fifth game.",
+    required=False,
+)
+@command_streaming()
+async def compare_prices(
+    ctx: discord.ApplicationContext,
+    game_1: str,
+    game_2: str,
+    game_3: str = None,
+    game_4: str = None,
+    game_5: str = None,
+):
+    """Compare the prices of up to five games."""
+    game_names = [name for name in [game_1, game_2, game_3, game_4, game_5] if name]
+    await compare_prices_response(ctx, game_names)
+
+
+@bot.slash_command()
+@discord.option(
+    name="target_price",
+    description="Target price for the imported games.",
+    input_type=float,
+)
+@command_streaming()
+async def import_watchlist(ctx: discord.ApplicationContext, target_price: float):
+    """Create price alerts for a list of games at once."""
+    from views import WatchlistImportModal
+
+    await ctx.send_modal(WatchlistImportModal(target_price))
+
+
 @bot.slash_command()
 @discord.option(
     name="game_name",
@@ -120,6 +203,91 @@ async def check_logs(ctx: discord.ApplicationContext):
     await ctx.respond(Logs.latest_str(), ephemeral=True)
 
 
+@bot.slash_command(guild_ids=bot.support_server)
+@commands.is_owner()
+@command_streaming()
+async def check_tasks(ctx: discord.ApplicationContext):
+    """Shows the state, last success and last run time of background tasks."""
+    await ctx.respond(f"```{tasks_status()[:1900]}```", ephemeral=True)
+
+
+@bot.slash_command(guild_ids=bot.support_server)
+@commands.is_owner()
+@command_streaming()
+async def check_metrics(ctx: discord.ApplicationContext):
+    """Shows request budget usage, queueing delay and other runtime metrics."""
+    await ctx.respond(f"```{metrics.report()[:1900]}```", ephemeral=True)
+
+
+@bot.slash_command(guild_ids=bot.support_server)
+@commands.is_owner()
+@command_streaming()
+async def check_memory(ctx: discord.ApplicationContext):
+    """Shows the RSS and the approximate memory held by each subsystem."""
+    await ctx.respond(f"```{memory_report()[:1900]}```", ephemeral=True)
+
+
+@bot.slash_command(guild_ids=bot.support_server)
+@commands.is_owner()
+@option(
+    "action",
+    description="Show, enable, disable or reset the SQL profiler.",
+    choices=["Show", "Enable", "Disable", "Reset"],
+)
+@command_streaming()
+async def sql_profile(ctx: discord.ApplicationContext, action: str):
+    """Shows the call sites and statements that dominate database time."""
+    if action == "Enable":
+        for engine in [models.engine, *models.replica_engines]:
+            profiler.install(engine)
+    elif action == "Disable":
+        profiler.enabled = False
+    elif action == "Reset":
+        profiler.reset()
+    await ctx.respond(f"```{profiler.report()[:1900]}```", ephemeral=True)
+
+
+def profile_target_names() -> list[str]:
+    """Tasks, deadline handlers and commands that can be profiled. A task and
+    a command can share a name, so each is prefixed with its kind."""
+    names = [f"task:{task.name}" for task in supervised_tasks]
+    names += [f"deadline:{handler.__name__}" for handler in deadlines.handlers()]
+    names += [f"command:{command.name}" for command in bot.application_commands]
+    return sorted(set(names))
+
+
+async def profile_targets(ctx: discord.AutocompleteContext) -> list[str]:
+    return [name for name in profile_target_names() if ctx.value in name][:25]
+
+
+@bot.slash_command(guild_ids=bot.support_server)
+@commands.is_owner()
+@option(
+    "target", description="Task or command to profile.", autocomplete=profile_targets
+)
+@option("mode", description="Profiler to run.", choices=list(MODES))
+@command_streaming()
+async def profile_next(ctx: discord.ApplicationContext, target: str, mode: str):
+    """Profiles the next run of a task or command and posts the result."""
+    if target not in profile_target_names():
+        response = f"Unknown target {target}, pick one of the suggestions."
+        await ctx.respond(f"```{response}```", ephemeral=True)
+        return
+    run_profiler.arm(target, mode)
+    response = f"The next run of {target} will be profiled with {mode}."
+    await ctx.respond(f"```{response}```", ephemeral=True)
+
+
+@bot.slash_command(guild_ids=bot.support_server)
+@commands.is_owner()
+@command_streaming()
+async def check_schema(ctx: discord.ApplicationContext):
+    """Shows the schema version and whether the hot queries use their indexes."""
+    from migrations import check_report
+
+    await ctx.respond(f"```{check_report()[:1900]}```", ephemeral=True)
+
+
 @bot.slash_command(guild_ids=bot.support_server)
 @commands.is_owner()
 @discord.option(
@@ -128,7 +296,8 @@ async def check_logs(ctx: discord.ApplicationContext):
 )
 @discord.option(name="Key", description="Key for the game")
 async def giveaway_creation(ctx: discord.ApplicationContext, app_id: str, key: str):
-    LocalGiveaways.add_giveaway(app_id, key)
+    giveaway = LocalGiveaways.add_giveaway(app_id, key)
+    deadlines.schedule("local_giveaway_end", giveaway.id, giveaway.end_time)
     await ctx.respond("Giveaway Created", ephemeral=True)
 
 
@@ -161,11 +330,12 @@ async def delete_alerts(ctx: discord.ApplicationContext, type: str):
         await ctx.followup.send("There was an error. Check the support server.")
 
 
-def alert_channel_str(alerts: list) -> str:
+def alert_channel_str(alerts: list, table) -> str:
     """Creates a formatted strings for alerts. Used to send to embed fields."""
-    if type(alerts[0]) == PriceAlerts:
+    if table == PriceAlerts:
         alert_channels = [
-            f"<#{alert.channel}>: `{alert.game_name} under ${alert.price}`"
+            f"<#{alert.channel}>: "
+            f"`{alert.game_name} under {format_price(alert.price, alert.region)}`"
             for alert in alerts
         ]
     else:
@@ -173,6 +343,20 @@ def alert_channel_str(alerts: list) -> str:
     return "\n".join(alert_channels)
 
 
+@bot.slash_command()
+@discord.default_permissions(manage_guild=True)
+@option(
+    "region",
+    description="Store region and currency used for prices and alerts.",
+    choices=list(REGIONS),
+)
+@command_streaming()
+async def set_region(ctx: discord.ApplicationContext, region: str):
+    """Set the price region and currency for your server."""
+    ServerSettings.set_region(ctx.guild.id, region)
+    await ctx.respond(f"Prices on this server now use the `{region}` region.")
+
+
 @bot.slash_command()
 @command_streaming()
 async def check_alerts(ctx: discord.ApplicationContext):
@@ -188,7 +372,7 @@ async def check_alerts(ctx: discord.ApplicationContext):
     for item in alert_names:
         alerts = item[0].get_alerts(ctx.guild.id)
         if alerts:
-            embed.add_field(name=item[1], value=alert_channel_str(alerts), inline=False)
+            embed.add_field(name=item[1], value=alert_channel_str(alerts, item[0]), inline=False)
     await ctx.respond(embed=embed)
 
 
@@ -196,13 +380,15 @@ async def check_alerts(ctx: discord.ApplicationContext):
 @command_streaming()
 async def upcoming_steam_sales(ctx: discord.ApplicationContext):
     """See all upcoming steam sales."""
-    paginator = pages.Paginator(pages=await UpcomingSteamSales.all_sales_embeds())
+    paginator = pages.Paginator(pages=list(await UpcomingSteamSales.all_sales_embeds()))
     await paginator.respond(ctx.interaction, ephemeral=False)
 
 
 @bot.event
 async def on_dbl_vote(data) -> None:
-    """Sends a message to the votes channel when a user votes on the bot."""
+    """Records the vote in the local ledger and sends a message to the votes
+    channel when a user votes on the bot."""
+    vote_ledger.record(int(data["user"]))
 
     embed = discord.Embed(title=f"Thanks for the Vote!🎉", timestamp=datetime.now())
     channel = await bot.fetch_channel(bot.vote_channel)
@@ -214,5 +400,21 @@ async def on_dbl_vote(data) -> None:
     await channel.send(embed=embed)
 
 
-bot.add_application_command(create)
-bot.run(DISCORD_TOKEN)
+def create_app(check_schema: bool = None, webhooks: bool = True) -> discord.Bot:
+    """Application factory. Connects to the database, optionally checks the
+    schema, starts the top.gg webhook and registers the command groups.
+    Interaction handler processes skip the webhook."""
+    if check_schema is None:
+        check_schema = os.getenv("DB_CHECK_SCHEMA", "1") == "1"
+    init_db(check_schema=check_schema)
+    startup.mark("db_connect")
+    if webhooks:
+        setup_topgg()
+    bot.add_application_command(create)
+    return bot
+
+
+startup.mark("import")
+
+if __name__ == "__main__":
+    create_app().run(DISCORD_TOKEN)
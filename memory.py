@@ -0,0 +1,93 @@
+import gc
+import resource
+import sys
+import tracemalloc
+import types
+
+from sqlalchemy.orm.session import _sessions
+
+from bot import bot
+from metrics import metrics
+
+# Objects visited per subsystem before the size estimate gives up.
+MAX_OBJECTS = 200_000
+
+# Shared objects that a walk must not follow, or every subsystem would
+# include the whole client.
+SKIPPED_TYPES = (type, types.ModuleType, types.FunctionType, types.MethodType)
+
+
+def rss_bytes() -> int:
+    """Current resident set size, or the peak where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def deep_size(roots: list, exclude: set) -> tuple[int, int, bool]:
+    """Approximate size of everything reachable from the roots. Returns the
+    bytes, the object count and whether the walk was cut off."""
+    seen = set(exclude)
+    stack = list(roots)
+    size = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, SKIPPED_TYPES):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj, 0)
+        if len(seen) > MAX_OBJECTS:
+            return size, len(seen) - len(exclude), True
+        stack.extend(gc.get_referents(obj))
+    return size, len(seen) - len(exclude), False
+
+
+def subsystems() -> dict:
+    """Roots of the memory held by each subsystem."""
+    from models import UpcomingSteamSales, ServerSettings
+    from price_history import price_history
+    from polling import poll_scheduler
+    from votes import vote_ledger
+    from query_profiler import profiler
+
+    state = bot._connection
+    return {
+        "gateway cache": [state._guilds, state._users, state._messages],
+        "views": [state._view_store._views, state._modal_store._modals],
+        "http client": [bot.http.__dict__],
+        "db identity maps": [
+            session.identity_map for session in list(_sessions.values())
+        ],
+        "price history": [price_history.recent],
+        "poll scheduler": [
+            poll_scheduler.next_due,
+            poll_scheduler.polled_thresholds,
+            poll_scheduler.sales,
+        ],
+        "vote ledger": [vote_ledger.latest, vote_ledger.counts],
+        "sale pages": [UpcomingSteamSales._pages, ServerSettings._regions],
+        "profilers": [profiler.statements, profiler.call_sites, metrics.timings],
+    }
+
+
+def memory_report() -> str:
+    rss = rss_bytes()
+    metrics.gauge("memory.rss_mb", rss / 2**20)
+    exclude = {id(bot), id(bot._connection), id(bot.http), id(bot.loop)}
+    lines = [
+        f"RSS {rss / 2**20:.1f} MB | guilds {len(bot.guilds)} | "
+        f"users {len(bot.users)} | messages {len(bot.cached_messages)}",
+        "Approximate size of what each subsystem keeps alive:",
+    ]
+    for name, roots in subsystems().items():
+        size, count, truncated = deep_size(roots, exclude)
+        metrics.gauge(f"memory.{name.replace(' ', '_')}_mb", size / 2**20)
+        more = "+" if truncated else ""
+        lines.append(f"{name}: {size / 2**20:.2f}{more} MB in {count}{more} objects")
+    if tracemalloc.is_tracing():
+        lines.append("Top allocations:")
+        stats = tracemalloc.take_snapshot().statistics("filename")
+        lines += [f"{stat.size / 2**20:.2f} MB {stat.traceback}" for stat in stats[:8]]
+    return "\n".join(lines)
@@ -0,0 +1,54 @@
+from collections import Counter, defaultdict
+
+
+class Timing:
+    """Count, total and maximum of an observed duration."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+class Metrics:
+    """In-process counters, gauges and timings. Subsystems write to the
+    shared instance and owners read it through the check_metrics command."""
+
+    def __init__(self):
+        self.counters = Counter()
+        self.gauges = {}
+        self.timings = defaultdict(Timing)
+
+    def inc(self, name: str, value: int = 1) -> None:
+        self.counters[name] += value
+
+    def gauge(self, name: str, value: float) -> None:
+        self.gauges[name] = value
+
+    def observe(self, name: str, seconds: float) -> None:
+        self.timings[name].add(seconds)
+
+    def report(self, prefix: str = "") -> str:
+        lines = []
+        for name, value in sorted(self.counters.items()):
+            if name.startswith(prefix):
+                lines.append(f"{name}: {value}")
+        for name, value in sorted(self.gauges.items()):
+            if name.startswith(prefix):
+                lines.append(f"{name}: {value:.2f}")
+        for name, timing in sorted(self.timings.items()):
+            if name.startswith(prefix) and timing.count:
+                lines.append(
+                    f"{name}: n={timing.count} "
+                    f"avg={timing.total / timing.count * 1000:.0f}ms "
+                    f"max={timing.max * 1000:.0f}ms"
+                )
+        return "\n".join(lines) or "No metrics recorded."
+
+
+metrics = Metrics()
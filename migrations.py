@@ -0,0 +1,242 @@
+import json
+import sys
+
+from sqlalchemy import text
+
+import models
+
+# Ordered schema changes, recorded in schema_version. Statements use IF NOT
+# EXISTS so databases created by create_all, which already have some of
+# these, migrate cleanly.
+MIGRATIONS = [
+    (
+        1,
+        "regions and float price setpoints",
+        [
+            "ALTER TABLE price_alerts ADD COLUMN IF NOT EXISTS region varchar",
+            "UPDATE price_alerts SET region = 'us' WHERE region IS NULL",
+            "ALTER TABLE price_alerts ALTER COLUMN region SET DEFAULT 'us'",
+            "ALTER TABLE price_alerts ALTER COLUMN region SET NOT NULL",
+            "ALTER TABLE price_alerts ALTER COLUMN price TYPE double precision",
+            "ALTER TABLE price_history ADD COLUMN IF NOT EXISTS region varchar",
+            "UPDATE price_history SET region = 'us' WHERE region IS NULL",
+        ],
+    ),
+    (
+        2,
+        "unique g2a ids for the catalog upsert",
+        [
+            "DELETE FROM g2a a USING g2a b WHERE a.g2a_id = b.g2a_id AND a.id < b.id",
+            "CREATE UNIQUE INDEX IF NOT EXISTS g2a_g2a_id_key ON g2a (g2a_id)",
+        ],
+    ),
+    (
+        3,
+        "alert table server and channel indexes",
+        [
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})"
+            for table in [
+                "giveaway_alerts",
+                "freetoplay_alerts",
+                "gamepass_alerts",
+                "price_alerts",
+            ]
+            for column in ["server", "channel"]
+        ]
+        + [
+            "CREATE INDEX IF NOT EXISTS ix_price_alerts_region_plain "
+            "ON price_alerts (region, game_plain)",
+        ],
+    ),
+    (
+        4,
+        "partial indexes on un-alerted rows",
+        [
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_unalerted "
+            f"ON {table} ({column}) WHERE alerted = false"
+            for table, column in [
+                ("gamerpower", "id"),
+                ("free_to_game", "id"),
+                ("gamepass", "id"),
+                ("local_giveaways", "id"),
+                ("steam_free_games_calendar", "release_date"),
+                ("upcoming_steam_sales", "start"),
+            ]
+        ],
+    ),
+    (
+        5,
+        "game name search indexes",
+        [
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            "CREATE INDEX IF NOT EXISTS ix_steam_apps_name_trgm "
+            "ON steam_apps USING gin (name gin_trgm_ops)",
+            "CREATE INDEX IF NOT EXISTS ix_steam_apps_name ON steam_apps (name)",
+            "CREATE INDEX IF NOT EXISTS ix_g2a_title_trgm "
+            "ON g2a USING gin (title gin_trgm_ops)",
+            "CREATE INDEX IF NOT EXISTS ix_g2a_region_platform "
+            "ON g2a (region, platform)",
+        ],
+    ),
+    (
+        6,
+        "history, vote and delivery queue indexes",
+        [
+            "CREATE INDEX IF NOT EXISTS ix_price_history_region_plain_time "
+            "ON price_history (region, plain, time)",
+            'CREATE INDEX IF NOT EXISTS ix_votes_user_time ON votes ("user", time)',
+            "CREATE INDEX IF NOT EXISTS ix_delivery_queue_available "
+            "ON delivery_queue (available_at, id)",
+        ],
+    ),
+]
+
+# Hot queries and the index each one is expected to use.
+EXPLAIN_CHECKS = [
+    (
+        "get_closest_names",
+        "SELECT name FROM steam_apps WHERE name % 'portal' "
+        "ORDER BY name <-> 'portal' LIMIT 20",
+        "ix_steam_apps_name_trgm",
+    ),
+    (
+        "get_steam_appids",
+        "SELECT t.title, m.appid FROM unnest(ARRAY['portal']) AS t(title) "
+        "CROSS JOIN LATERAL (SELECT appid FROM steam_apps WHERE name % t.title "
+        "ORDER BY name <-> t.title LIMIT 1) m",
+        "ix_steam_apps_name_trgm",
+    ),
+    (
+        "get_game_appid",
+        "SELECT appid FROM steam_apps WHERE name = 'Portal 2'",
+        "ix_steam_apps_name",
+    ),
+    (
+        "key price",
+        "SELECT * FROM g2a WHERE title LIKE '%Portal%' "
+        "AND region = 'GLOBAL' AND platform = 'Steam' LIMIT 1",
+        "ix_g2a_title_trgm",
+    ),
+    (
+        "server_alert_count",
+        "SELECT count(*) FROM giveaway_alerts WHERE server = 0",
+        "ix_giveaway_alerts_server",
+    ),
+    (
+        "get_alert_channels",
+        "SELECT DISTINCT channel FROM freetoplay_alerts",
+        "ix_freetoplay_alerts_channel",
+    ),
+    (
+        "send_price_alerts",
+        "SELECT id FROM price_alerts WHERE region = 'us' "
+        "AND game_plain IN ('portalii', 'halflife')",
+        "ix_price_alerts_region_plain",
+    ),
+    (
+        "get_unalerted_rows",
+        "SELECT id FROM gamerpower WHERE alerted = false",
+        "ix_gamerpower_unalerted",
+    ),
+    (
+        "steam_free_release_alert",
+        "SELECT id FROM steam_free_games_calendar "
+        "WHERE alerted = false AND release_date < now()",
+        "ix_steam_free_games_calendar_unalerted",
+    ),
+    (
+        "price history preload",
+        "SELECT time, price_cents FROM price_history WHERE region = 'us' "
+        "AND plain IN ('portalii') AND time >= now() - interval '90 days'",
+        "ix_price_history_region_plain_time",
+    ),
+    (
+        "delivery claim",
+        "SELECT * FROM delivery_queue WHERE available_at <= now() "
+        "ORDER BY available_at, id LIMIT 20 FOR UPDATE SKIP LOCKED",
+        "ix_delivery_queue_available",
+    ),
+]
+
+
+def current_version(conn) -> int:
+    conn.execute(
+        text(
+            "CREATE TABLE IF NOT EXISTS schema_version "
+            "(version integer PRIMARY KEY, description varchar, applied_at timestamp)"
+        )
+    )
+    stmt = text("SELECT coalesce(max(version), 0) FROM schema_version")
+    return conn.execute(stmt).scalar()
+
+
+def migrate(engine=None) -> list[int]:
+    """Applies the pending migrations in one transaction and returns their
+    versions. An advisory lock keeps concurrently starting processes from
+    migrating twice."""
+    engine = engine or models.engine
+    applied = []
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('migrations'))"))
+        version = current_version(conn)
+        for number, description, statements in MIGRATIONS:
+            if number <= version:
+                continue
+            for statement in statements:
+                conn.execute(text(statement))
+            conn.execute(
+                text(
+                    "INSERT INTO schema_version VALUES (:version, :description, now())"
+                ),
+                {"version": number, "description": description},
+            )
+            applied.append(number)
+    return applied
+
+
+def plan_indexes(plan: dict) -> set[str]:
+    """Collects the index names used anywhere in an EXPLAIN JSON plan."""
+    indexes = {plan["Index Name"]} if "Index Name" in plan else set()
+    for child in plan.get("Plans", []):
+        indexes |= plan_indexes(child)
+    return indexes
+
+
+def explain_check(engine=None) -> list[tuple]:
+    """Explains the hot queries and returns (name, expected index, used
+    indexes, ok) for each. Sequential scans are disabled for the check, so it
+    verifies that the planner can use each index even on tables that are
+    still small enough for a scan to be cheaper."""
+    engine = engine or models.engine
+    results = []
+    with engine.connect() as conn:
+        with conn.begin():
+            conn.execute(text("SET LOCAL enable_seqscan = off"))
+            for name, query, expected in EXPLAIN_CHECKS:
+                plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {query}")).scalar()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                used = plan_indexes(plan[0]["Plan"])
+                results.append((name, expected, used, expected in used))
+    return results
+
+
+def check_report(engine=None) -> str:
+    engine = engine or models.engine
+    with engine.begin() as conn:
+        version = current_version(conn)
+    lines = [f"Schema version {version} of {MIGRATIONS[-1][0]}"]
+    for name, expected, used, ok in explain_check(engine):
+        status = "ok" if ok else f"MISSING (uses {', '.join(used) or 'no index'})"
+        lines.append(f"{name}: {expected} {status}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # Usage: python migrations.py [check]
+    models.init_db()
+    if sys.argv[1:] == ["check"]:
+        report = check_report()
+        print(report)
+        sys.exit("MISSING" in report)
+    print(f"Applied migrations: {migrate() or 'none'}")
@@ -1,6 +1,7 @@
 from sqlalchemy import (
     Column,
     Integer,
+    SmallInteger,
     BIGINT,
     String,
     Boolean,
@@ -8,23 +9,59 @@ from sqlalchemy import (
     Float,
     JSON,
     select,
+    insert,
     delete,
+    func,
     create_engine,
+    inspect,
+    tuple_,
 )
 import discord
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import declarative_base, sessionmaker
 from datetime import datetime, timedelta
+import functools
 import os
+import random
+import time
 from typing import Union
 
-CONNECTION_STRING = os.getenv("CONNECTION_STRING")
+from query_profiler import profiler
 
-engine = create_engine(CONNECTION_STRING)
+CONNECTION_STRING = os.getenv("CONNECTION_STRING")
+# Comma separated connection strings of read replicas, optional.
+READ_REPLICA_URLS = os.getenv("READ_REPLICA_URLS")
+# Seconds a server's reads stay on the primary after it changed its alerts,
+# so replication lag never hides a change the user just made.
+READ_YOUR_WRITES_WINDOW = timedelta(seconds=30)
+
+engine = None
+replica_engines = []
 Base = declarative_base()
-Session = sessionmaker(engine)
+Session = sessionmaker()
+
+_recent_writes = {}
 
 alert_color = discord.Color.red()
 
+# ITAD regions with their country and currency symbol.
+REGIONS = {
+    "us": ("US", "$"),
+    "ca": ("CA", "CA$"),
+    "uk": ("GB", "£"),
+    "eu1": ("DE", "€"),
+    "eu2": ("PL", "€"),
+    "au2": ("AU", "A$"),
+    "br2": ("BR", "R$"),
+}
+DEFAULT_REGION = "us"
+
+
+def format_price(price: float, region: str = DEFAULT_REGION) -> str:
+    """Formats an alert setpoint in the currency of a region."""
+    symbol = REGIONS.get(region or DEFAULT_REGION, REGIONS[DEFAULT_REGION])[1]
+    return f"{symbol}{price:g}"
+
 
 def embed_listed_field(name: str, values: Union[dict, str]) -> discord.EmbedField:
     """Creates a easily readable and clean formatted field for discord embeds."""
@@ -58,6 +95,101 @@ def embed_cta():
     return embed_listed_field("Support Us", values)
 
 
+@functools.lru_cache(maxsize=None)
+def record_type(table, columns: tuple) -> type:
+    """Builds a lightweight __slots__ class for a projection of a table. The
+    embed methods are borrowed from the table, so records can stand in for
+    ORM entities as long as the projection has the columns they read."""
+    namespace = {"__slots__": columns}
+    for method in ("alert_embed", "info_embed"):
+        if method in vars(table):
+            namespace[method] = vars(table)[method]
+
+    def __init__(self, *values):
+        for name, value in zip(columns, values):
+            setattr(self, name, value)
+
+    namespace["__init__"] = __init__
+    return type(f"{table.__name__}Record", (), namespace)
+
+
+def mark_written(server: int) -> None:
+    """Pins the reads of a server to the primary for a short while. The write
+    time is also stored on the primary, so the pin holds in every process,
+    including the interaction handlers that serve the user's next request."""
+    _recent_writes[server] = time.monotonic()
+    if not replica_engines:
+        return
+    stmt = pg_insert(RecentWrites).values(server=server, written_at=func.now())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[RecentWrites.server], set_={"written_at": func.now()}
+    )
+    with Session() as session:
+        session.execute(stmt)
+        session.commit()
+
+
+def written_recently(server: int) -> bool:
+    """Whether the server wrote within the read-your-writes window, in this
+    process or, checked on the primary, in any other."""
+    written = _recent_writes.get(server)
+    window = READ_YOUR_WRITES_WINDOW.total_seconds()
+    if written and time.monotonic() - written < window:
+        return True
+    stmt = select(RecentWrites.server).where(
+        RecentWrites.server == server,
+        RecentWrites.written_at > func.now() - READ_YOUR_WRITES_WINDOW,
+    )
+    with Session() as session:
+        return session.execute(stmt).first() is not None
+
+
+def read_session(server: int = None):
+    """Session for read-only helpers. Uses a random replica when replicas are
+    configured, except for a server that changed its alerts within the
+    read-your-writes window. Paths that write use Session."""
+    if not replica_engines:
+        return Session()
+    if server is not None and written_recently(server):
+        return Session()
+    return Session(bind=random.choice(replica_engines))
+
+
+def select_records(table, columns: tuple, *criteria, server: int = None) -> list:
+    """Selects only the given columns of a table as lightweight records,
+    reading from a replica unless the server wrote recently."""
+    record = record_type(table, columns)
+    stmt = select(*[getattr(table, column) for column in columns]).where(*criteria)
+    with read_session(server) as session:
+        return [record(*row) for row in session.execute(stmt)]
+
+
+def stream_records(table, columns: tuple, *criteria, chunk_size: int = 500):
+    """Yields chunks of lightweight records, so memory stays flat no matter
+    how many rows match. Each chunk is a separate query paginated by primary
+    key in its own session, so no cursor or transaction is held open while
+    the caller awaits sends. Callers may update or delete yielded rows."""
+    record = record_type(table, columns)
+    primary_key = list(inspect(table).primary_key)
+    stmt = (
+        select(*primary_key, *[getattr(table, column) for column in columns])
+        .where(*criteria)
+        .order_by(*primary_key)
+        .limit(chunk_size)
+    )
+    last = None
+    while True:
+        chunk = stmt if last is None else stmt.where(tuple_(*primary_key) > last)
+        with Session() as session:
+            rows = session.execute(chunk).all()
+        if not rows:
+            return
+        last = tuple(rows[-1][: len(primary_key)])
+        yield [record(*row[len(primary_key) :]) for row in rows]
+        if len(rows) < chunk_size:
+            return
+
+
 # Giveaway tables
 class GamerPowerData(Base):
     __tablename__ = "gamerpower"
@@ -80,6 +212,18 @@ class GamerPowerData(Base):
     open_giveaway = Column(String)
     alerted = Column(Boolean)
 
+    # Columns read by the alert loops and embeds.
+    alert_columns = (
+        "id",
+        "title",
+        "type",
+        "worth",
+        "end_date",
+        "open_giveaway",
+        "description",
+        "image",
+    )
+
     def alert_embed(self) -> discord.Embed:
         """Creates an alert embed which can be sent to discord channels."""
         embed = discord.Embed(
@@ -111,11 +255,10 @@ class GiveawayAlerts(Base):
 
     @staticmethod
     def get_alerts(server: int) -> list:
-        """Gets all active alerts for a server."""
-        with Session() as session:
-            stmt = select(GiveawayAlerts).where(GiveawayAlerts.server == server)
-            results = session.execute(stmt).scalars().all()
-        return results
+        """Gets all active alerts for a server as lightweight records."""
+        return select_records(
+            GiveawayAlerts, ("channel",), GiveawayAlerts.server == server, server=server
+        )
 
     @staticmethod
     def add_alert(ctx: discord.ApplicationContext, mentions: list[int] = None) -> None:
@@ -130,6 +273,7 @@ class GiveawayAlerts(Base):
         with Session() as session:
             session.add(alert)
             session.commit()
+        mark_written(ctx.guild.id)
 
 
 # Free to play tables
@@ -145,11 +289,10 @@ class FreeToPlayAlerts(Base):
 
     @staticmethod
     def get_alerts(server: int) -> list:
-        """Gets all active alerts for a server."""
-        with Session() as session:
-            stmt = select(FreeToPlayAlerts).where(FreeToPlayAlerts.server == server)
-            results = session.execute(stmt).scalars().all()
-        return results
+        """Gets all active alerts for a server as lightweight records."""
+        return select_records(
+            FreeToPlayAlerts, ("channel",), FreeToPlayAlerts.server == server, server=server
+        )
 
     @staticmethod
     def add_alert(ctx: discord.ApplicationContext, mentions: list[int] = None) -> None:
@@ -164,6 +307,7 @@ class FreeToPlayAlerts(Base):
         with Session() as session:
             session.add(alert)
             session.commit()
+        mark_written(ctx.guild.id)
 
 
 class FreeToGameData(Base):
@@ -182,6 +326,17 @@ class FreeToGameData(Base):
     freetogame_profile_url = Column(String)
     alerted = Column(Boolean)
 
+    alert_columns = (
+        "id",
+        "title",
+        "genre",
+        "platform",
+        "release_date",
+        "freetogame_profile_url",
+        "short_description",
+        "thumbnail",
+    )
+
     def alert_embed(self) -> discord.Embed:
         """Creates an alert embed which can be sent to discord channels."""
         embed = discord.Embed(
@@ -216,6 +371,17 @@ class GamePassData(Base):
     status = Column(String)
     alerted = Column(Boolean, default=False)
 
+    alert_columns = (
+        "id",
+        "title",
+        "category",
+        "developer",
+        "publisher",
+        "url",
+        "description",
+        "image_url",
+    )
+
     def alert_embed(self) -> discord.Embed:
         """Creates an alert embed which can be sent to discord channels."""
         embed = discord.Embed(
@@ -247,11 +413,10 @@ class GamePassAlerts(Base):
 
     @staticmethod
     def get_alerts(server: int) -> list:
-        """Gets all active alerts for a server."""
-        with Session() as session:
-            stmt = select(GamePassAlerts).where(GamePassAlerts.server == server)
-            results = session.execute(stmt).scalars().all()
-        return results
+        """Gets all active alerts for a server as lightweight records."""
+        return select_records(
+            GamePassAlerts, ("channel",), GamePassAlerts.server == server, server=server
+        )
 
     @staticmethod
     def add_alert(ctx: discord.ApplicationContext, mentions: list[int] = None) -> None:
@@ -266,6 +431,7 @@ class GamePassAlerts(Base):
         with Session() as session:
             session.add(alert)
             session.commit()
+        mark_written(ctx.guild.id)
 
 
 # Price Tables
@@ -277,27 +443,41 @@ class PriceAlerts(Base):
     server = Column(BIGINT)
     channel = Column(BIGINT)
     mentions = Column(JSON)
-    price = Column(Integer)
+    price = Column(Float)
+    region = Column(String, default=DEFAULT_REGION, nullable=False)
     game_plain = Column(String)
     game_name = Column(String)
     image_url = Column(String)
     creation_time = Column(DateTime)
 
+    alert_columns = (
+        "id",
+        "channel",
+        "price",
+        "region",
+        "game_plain",
+        "game_name",
+        "image_url",
+    )
+
     @staticmethod
     def get_alerts(server: int) -> list:
-        """Gets all active alerts for a server."""
-        with Session() as session:
-            stmt = select(PriceAlerts).where(PriceAlerts.server == server)
-            results = session.execute(stmt).scalars().all()
-        return results
+        """Gets all active alerts for a server as lightweight records."""
+        return select_records(
+            PriceAlerts,
+            ("channel", "game_name", "price", "region"),
+            PriceAlerts.server == server,
+            server=server,
+        )
 
     @staticmethod
     def add_alert(
         ctx: discord.Interaction,
         game_name: str,
         image_url: str,
-        price: int,
+        price: float,
         game_plain: str,
+        region: str = DEFAULT_REGION,
         mentions: list[int] = None,
     ) -> None:
         """Creates an alert given a discord context, ITAD game plain, and price
@@ -307,6 +487,7 @@ class PriceAlerts(Base):
             server=ctx.guild.id,
             channel=ctx.channel_id,
             price=price,
+            region=region,
             game_name=game_name,
             image_url=image_url,
             game_plain=game_plain,
@@ -316,6 +497,17 @@ class PriceAlerts(Base):
         with Session() as session:
             session.add(alert)
             session.commit()
+        mark_written(ctx.guild.id)
+
+    @staticmethod
+    def add_alerts(alerts: list[dict]) -> None:
+        """Creates many alerts in a single bulk insert. Used by the watchlist
+        import."""
+        with Session() as session:
+            session.execute(insert(PriceAlerts), alerts)
+            session.commit()
+        for server in {alert["server"] for alert in alerts}:
+            mark_written(server)
 
     @staticmethod
     async def delete_alert(alert) -> None:
@@ -336,11 +528,23 @@ class PriceAlerts(Base):
             await ctx.respond("You have no price alerts set.", ephemeral=True)
 
 
+class PriceHistory(Base):
+    __tablename__ = "price_history"
+
+    id = Column(BIGINT, primary_key=True)
+    plain = Column(String)
+    region = Column(String, default=DEFAULT_REGION)
+    time = Column(DateTime)
+    price_cents = Column(Integer)
+    cut = Column(SmallInteger)
+    store = Column(String)
+
+
 class G2AData(Base):
     __tablename__ = "g2a"
 
     id = Column(Integer, primary_key=True)
-    g2a_id = Column(BIGINT)
+    g2a_id = Column(BIGINT, unique=True)
     title = Column(String)
     slug = Column(String)
     minprice = Column(Float)
@@ -366,6 +570,8 @@ class LocalGiveaways(Base):
     winner = Column(BIGINT)
     alerted = Column(Boolean, default=False)
 
+    alert_columns = ("id", "appid", "end_time")
+
     @staticmethod
     def add_giveaway(appid: int, key: str):
         giveaway = LocalGiveaways(
@@ -374,9 +580,10 @@ class LocalGiveaways(Base):
             creation_time=datetime.now(),
             end_time=datetime.now() + timedelta(days=7),
         )
-        with Session() as session:
+        with Session(expire_on_commit=False) as session:
             session.add(giveaway)
             session.commit()
+        return giveaway
 
     async def alert_embed(self):
         from price import fetch_steam_app_details, fetch_steam_app_reviews
@@ -414,6 +621,8 @@ class SteamFreeGamesCalendar(Base):
     release_date = Column(DateTime)
     alerted = Column(Boolean, default=False)
 
+    alert_columns = ("id",)
+
     async def alert_embed(self):
         from price import fetch_steam_app_details
 
@@ -444,8 +653,14 @@ class UpcomingSteamSales(Base):
     link = Column(String)
     alerted = Column(Boolean, default=False)
 
+    # Prebuilt /upcoming_steam_sales pages and the table version they match.
+    _pages = []
+    _pages_version = None
+    _version_checked = datetime.min
+    version_ttl = timedelta(minutes=1)
+
     async def info_embed(self):
-        embed = discord.Embed(title=f"Upcoming Steam Sales", timestamp=datetime.now())
+        embed = discord.Embed(title="Upcoming Steam Sales", timestamp=datetime.now())
         start_date = self.start.strftime("%b %-d")
         end_date = self.end.strftime("%b %-d")
         sale_details = {
@@ -460,12 +675,120 @@ class UpcomingSteamSales(Base):
             embed.set_image(url=self.image)
         return embed
 
+    @staticmethod
+    def table_version() -> tuple:
+        """Cheap fingerprint of the table, used to detect changes."""
+        with read_session() as session:
+            stmt = select(
+                func.count(),
+                func.max(UpcomingSteamSales.start),
+                func.max(UpcomingSteamSales.end),
+            )
+            return tuple(session.execute(stmt).one())
+
     @staticmethod
     async def all_sales_embeds():
+        """Returns the prebuilt sale pages. The version is checked at most once
+        per version_ttl and the pages are only rebuilt when it changed."""
+        cls = UpcomingSteamSales
+        if datetime.now() - cls._version_checked < cls.version_ttl:
+            return cls._pages
+        version = cls.table_version()
+        cls._version_checked = datetime.now()
+        if version != cls._pages_version:
+            with read_session() as session:
+                stmt = select(UpcomingSteamSales).order_by(UpcomingSteamSales.start)
+                sales = session.execute(stmt).scalars().all()
+            cls._pages = [await sale.info_embed() for sale in sales]
+            cls._pages_version = version
+        return cls._pages
+
+
+class ServerSettings(Base):
+    __tablename__ = "server_settings"
+
+    server = Column(BIGINT, primary_key=True)
+    region = Column(String, default=DEFAULT_REGION)
+
+    # Regions are read on every price lookup, so they are cached per server
+    # as (region, loaded at). Entries expire after region_ttl seconds, so a
+    # /set_region handled by another process is picked up.
+    _regions = {}
+    region_ttl = 300
+
+    @staticmethod
+    def get_region(server: int) -> str:
+        """Gets the ITAD region of a server, defaulting to the US."""
+        region, loaded = ServerSettings._regions.get(server, (None, None))
+        if loaded is None or time.monotonic() - loaded > ServerSettings.region_ttl:
+            with Session() as session:
+                stmt = select(ServerSettings.region).where(
+                    ServerSettings.server == server
+                )
+                region = session.execute(stmt).scalar() or DEFAULT_REGION
+            ServerSettings._regions[server] = (region, time.monotonic())
+        return region
+
+    @staticmethod
+    def set_region(server: int, region: str) -> None:
         with Session() as session:
-            sales = session.execute(select(UpcomingSteamSales)).scalars().all()
-        embeds = [await sale.info_embed() for sale in sales]
-        return embeds
+            session.merge(ServerSettings(server=server, region=region))
+            session.commit()
+        ServerSettings._regions[server] = (region, time.monotonic())
+
+
+class Votes(Base):
+    __tablename__ = "votes"
+
+    id = Column(Integer, primary_key=True)
+    user = Column(BIGINT)
+    time = Column(DateTime)
+    source = Column(String)
+
+
+class RecentWrites(Base):
+    """Last alert change of each server, read to keep the reads that follow
+    a write on the primary. Only written when read replicas are configured."""
+
+    __tablename__ = "recent_writes"
+
+    server = Column(BIGINT, primary_key=True)
+    written_at = Column(DateTime)
+
+
+class Deliveries(Base):
+    """Messages waiting to be sent by the delivery workers. Payloads are
+    already in Discord API form, so workers need nothing but a REST client."""
+
+    __tablename__ = "delivery_queue"
+
+    id = Column(Integer, primary_key=True)
+    channel = Column(BIGINT)
+    payload = Column(JSON)
+    source = Column(String)
+    attempts = Column(SmallInteger, default=0)
+    available_at = Column(DateTime)
+
+    @staticmethod
+    def rows(source: str, deliveries: list[tuple]) -> list[dict]:
+        now = datetime.now()
+        return [
+            {
+                "channel": channel,
+                "payload": payload,
+                "source": source,
+                "attempts": 0,
+                "available_at": now,
+            }
+            for channel, payload in deliveries
+        ]
+
+    @staticmethod
+    def discard(channels: set[int]) -> None:
+        """Drops the queued messages of channels that were pruned."""
+        with Session() as session:
+            session.execute(delete(Deliveries).where(Deliveries.channel.in_(channels)))
+            session.commit()
 
 
 class Logs(Base):
@@ -478,7 +801,7 @@ class Logs(Base):
 
     @staticmethod
     def latest_str():
-        with Session() as session:
+        with read_session() as session:
             stmt = select(Logs).order_by(Logs.id.desc()).limit(10)
             results = session.execute(stmt).scalars().all()
         return "\n".join(
@@ -486,4 +809,26 @@ class Logs(Base):
         )
 
 
-Base.metadata.create_all(bind=engine)
+def init_db(connection_string: str = None, check_schema: bool = False):
+    """Creates the engine, binds sessions to it and opens a first connection.
+    Importing this module never touches the database; the application factory
+    calls this once. The schema check creates missing tables and applies the
+    pending migrations, and is optional so redeploys can skip it."""
+    global engine
+    if engine is None:
+        engine = create_engine(connection_string or CONNECTION_STRING)
+        Session.configure(bind=engine)
+        for url in (READ_REPLICA_URLS or "").split(","):
+            if url.strip():
+                replica_engines.append(create_engine(url.strip()))
+        if os.getenv("SQL_PROFILE") == "1":
+            for bound in [engine, *replica_engines]:
+                profiler.install(bound)
+    with engine.connect():
+        pass
+    if check_schema:
+        from migrations import migrate
+
+        Base.metadata.create_all(bind=engine)
+        migrate(engine)
+    return engine
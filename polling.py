@@ -0,0 +1,102 @@
+import statistics
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from models import Session, UpcomingSteamSales
+from price_history import price_history
+
+MIN_INTERVAL = timedelta(minutes=15)
+MAX_INTERVAL = timedelta(hours=24)
+# Games on sale, or with a steam sale starting soon, are never polled less often.
+SALE_INTERVAL = timedelta(hours=1)
+
+
+class PollScheduler:
+    """Gives every watched (region, game plain) pair its own polling interval.
+
+    Plains whose price is close to the highest alert threshold are checked
+    often and plains far above every threshold rarely. Volatile prices and
+    steam sale windows shorten the interval. Plains that were never polled,
+    or whose highest threshold went up since their last poll, are due
+    immediately, so a new alert is checked on the next sweep."""
+
+    def __init__(self):
+        self.next_due = {}
+        self.polled_thresholds = {}
+        self.sales = []
+        self._sales_loaded = datetime.min
+
+    def due(self, thresholds: dict, now: datetime = None) -> list[tuple]:
+        """The (region, plain) keys of the thresholds that are due."""
+        now = now or datetime.now()
+        return [
+            key
+            for key, threshold in thresholds.items()
+            if self.next_due.get(key, datetime.min) <= now
+            or threshold > self.polled_thresholds.get(key, threshold)
+        ]
+
+    def load_sales(self) -> None:
+        """Caches the upcoming steam sale windows, refreshed hourly."""
+        if datetime.now() - self._sales_loaded < timedelta(hours=1):
+            return
+        with Session() as session:
+            stmt = select(UpcomingSteamSales.start, UpcomingSteamSales.end)
+            self.sales = session.execute(stmt).all()
+        self._sales_loaded = datetime.now()
+
+    def sales_changed(self) -> None:
+        """Makes the next sweep reload the sale windows."""
+        self._sales_loaded = datetime.min
+
+    def _sale_soon(self, now: datetime, interval: timedelta) -> bool:
+        return any(
+            start <= now + interval and (end is None or end >= now)
+            for start, end in self.sales
+        )
+
+    @staticmethod
+    def volatility(plain: str, region: str, days: int = 14) -> float:
+        """Coefficient of variation of the recently observed prices."""
+        cutoff = datetime.now() - timedelta(days=days)
+        window = price_history.window_for(plain, region)
+        prices = [obs.price for obs in window if obs.time >= cutoff]
+        if len(prices) < 2 or not statistics.mean(prices):
+            return 0.0
+        return statistics.pstdev(prices) / statistics.mean(prices)
+
+    def interval(
+        self, plain: str, region: str, overview: dict, threshold: float
+    ) -> timedelta:
+        """Polling interval from the distance to the threshold, the price
+        volatility and the steam sale calendar."""
+        current = ((overview or {}).get("price") or {}).get("price")
+        if not current:
+            return MIN_INTERVAL
+        gap = max(current - threshold, 0) / current
+        interval = MAX_INTERVAL * min(gap * 1.5, 1)
+        interval /= 1 + 5 * self.volatility(plain, region)
+        if overview["price"].get("cut") or self._sale_soon(datetime.now(), interval):
+            interval = min(interval, SALE_INTERVAL)
+        return max(interval, MIN_INTERVAL)
+
+    def polled(self, region: str, overviews: dict, thresholds: dict) -> None:
+        """Sets the next poll time of every plain in a region's overviews.
+        Thresholds are keyed by (region, plain)."""
+        self.load_sales()
+        now = datetime.now()
+        for plain, overview in overviews.items():
+            threshold = thresholds.get((region, plain), 0)
+            interval = self.interval(plain, region, overview, threshold)
+            self.next_due[(region, plain)] = now + interval
+            self.polled_thresholds[(region, plain)] = threshold
+
+    def forget(self, active_keys: set[tuple]) -> None:
+        """Drops (region, plain) pairs that no longer have alerts."""
+        for key in set(self.next_due) - active_keys:
+            del self.next_due[key]
+            self.polled_thresholds.pop(key, None)
+
+
+poll_scheduler = PollScheduler()
@@ -1,30 +1,116 @@
 import aiohttp
+import asyncio
+import codecs
+import json
 from typing import Union
 import os
 import discord
-from sqlalchemy import select
+from sqlalchemy import select, or_, text
 from models import (
     Session,
+    read_session,
     SteamApps,
     G2AData,
     embed_listed_field,
     embed_cta,
     PriceAlerts,
+    ServerSettings,
     alert_color,
+    format_price,
+    REGIONS,
+    DEFAULT_REGION,
 )
 import re
 
-from bot import bot
+from price_history import price_history
+from ratelimit import acquire_for
 
 ITAD_API = os.getenv("ITAD_API")
 
+# Deadlines, in seconds, for the parts of a price lookup that are filled in
+# after the first response.
+INFO_TIMEOUT = 5
+IMAGE_TIMEOUT = 5
+KEY_PRICE_TIMEOUT = 3
+
+# Most games a single /compare_prices can take.
+MAX_COMPARED_GAMES = 5
+
+# Bytes read at a time from a streamed response.
+STREAM_CHUNK_SIZE = 64 * 1024
+
 
 async def api_call(url, params: dict = None, headers: dict = None, ssl: bool = False):
+    await acquire_for(url)
     async with aiohttp.ClientSession() as session:
         async with session.get(url, params=params, headers=headers, ssl=False) as resp:
             return await resp.json()
 
 
+class JSONArrayStream:
+    """Incremental parser for the items of one JSON array in a document.
+
+    The array is the top-level value, or the first one stored under key. A
+    document without it yields nothing. Bytes are fed as they arrive and
+    complete items are returned as soon as they are parsed, so only one
+    partial item is held at a time."""
+
+    def __init__(self, key: str = None):
+        pattern = r"\[" if key is None else rf'"{re.escape(key)}"\s*:\s*\['
+        self.start = re.compile(pattern)
+        self.decoder = json.JSONDecoder()
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.started = self.finished = False
+
+    def feed(self, data: bytes, final: bool = False) -> list:
+        self.buffer += self.text.decode(data, final)
+        items = []
+        pos = 0
+        if not self.started:
+            match = self.start.search(self.buffer)
+            if match is None:
+                return items
+            self.started, pos = True, match.end()
+        while not self.finished:
+            while pos < len(self.buffer) and self.buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(self.buffer):
+                break
+            if self.buffer[pos] == "]":
+                self.finished = True
+                break
+            try:
+                item, end = self.decoder.raw_decode(self.buffer, pos)
+            except json.JSONDecodeError:
+                break
+            # A number at the end of the buffer may continue in the next chunk.
+            if end == len(self.buffer) and not final:
+                break
+            items.append(item)
+            pos = end
+        self.buffer = self.buffer[pos:]
+        if final and self.started and not self.finished:
+            raise ValueError("Response ended inside the streamed JSON array")
+        return items
+
+
+async def api_stream(url, key: str = None, params: dict = None, headers: dict = None):
+    """Yields the items of a JSON array in a response while the body is still
+    downloading, instead of loading the whole document like api_call."""
+    await acquire_for(url)
+    parser = JSONArrayStream(key)
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, params=params, headers=headers, ssl=False) as resp:
+            async for chunk in resp.content.iter_chunked(STREAM_CHUNK_SIZE):
+                for item in parser.feed(chunk):
+                    yield item
+                if parser.finished:
+                    return
+            for item in parser.feed(b"", final=True):
+                yield item
+
+
 async def fetch_itad_game_plain(game_name: str) -> dict:
     """Fetches price information using a game name."""
     url = "https://api.isthereanydeal.com/v02/search/search/"
@@ -33,17 +119,33 @@ async def fetch_itad_game_plain(game_name: str) -> dict:
     return result["data"]["results"][0]["plain"]
 
 
-async def fetch_itad_overview(game_plains: Union[str, list[str]] = None) -> dict:
-    """Fetches price information using steam app id.
+async def fetch_itad_overview(
+    game_plains: Union[str, list[str]] = None, region: str = DEFAULT_REGION
+) -> dict:
+    """Fetches price information for one or more plains in an ITAD region.
     Used for showing game price info to users."""
     if type(game_plains) == list:
         game_plains = ",".join(game_plains)
     url = "https://api.isthereanydeal.com/v01/game/overview/"
-    params = {"key": ITAD_API, "plains": game_plains}
+    params = {
+        "key": ITAD_API,
+        "plains": game_plains,
+        "region": region,
+        "country": REGIONS[region][0],
+    }
     result = await api_call(url, params)
     return result["data"]
 
 
+async def fetch_itad_plains_by_steam_ids(app_ids: list[int]) -> dict:
+    """Maps steam app ids to ITAD game plains in a single request."""
+    url = "https://api.isthereanydeal.com/v01/game/plain/id/"
+    ids = ",".join(f"app/{app_id}" for app_id in app_ids)
+    params = {"key": ITAD_API, "shop": "steam", "ids": ids}
+    result = await api_call(url, params)
+    return {int(key[4:]): plain for key, plain in result["data"].items() if plain}
+
+
 async def fetch_itad_info(game_plains: Union[str, list[str]] = None) -> dict:
     """Fetches price information using steam app id.
     Used for showing game price info to users."""
@@ -84,7 +186,7 @@ async def get_steam_image(game_name: str) -> str:
 def get_closest_names(game_str: str) -> list[str]:
     """Matches the closest game name in the steam_apps table to the user input.
     Returns the 20 closest matches."""
-    with Session() as session:
+    with read_session() as session:
         stmt = f"""SELECT name FROM steam_apps
             WHERE name % '{game_str}'
             ORDER BY name <-> '{game_str}'
@@ -113,24 +215,155 @@ async def get_game_appid(game_name: str) -> int:
 
 
 async def price_lookup_response(ctx: discord.ApplicationContext, game_name: str):
+    """Responds as soon as the current and lowest prices are known. The title,
+    image and key price are filled in afterwards by editing the message."""
     from views import CreateAlertView
 
     await ctx.response.defer()
-    game_name = get_closest_names(game_name.replace("'", "''"))[0]
-    game_name = re.sub("[^A-Za-z0-9- ]+", "", game_name)
+    region = ServerSettings.get_region(ctx.guild.id)
+    title = get_closest_names(game_name.replace("'", "''"))[0]
+    game_name = re.sub("[^A-Za-z0-9- ]+", "", title)
     game_plain = await fetch_itad_game_plain(game_name)
-    info = await PriceInfo.create_one(game_plain)
-    embed = info.info_embed()
-    view = CreateAlertView(info)
-    await ctx.respond(embed=embed, view=view)
+    info_task = asyncio.create_task(fetch_itad_info(game_plain))
+    try:
+        itad_overview = await fetch_itad_overview(game_plain, region)
+        info = PriceInfo(
+            game_plain, itad_overview[game_plain], {"title": title}, region
+        )
+        await price_history.preload_async([game_plain], region)
+        view = CreateAlertView(info)
+        await ctx.respond(embed=info.info_embed(), view=view)
+        await info.enrich(ctx, info_task)
+    finally:
+        # Only still running when the lookup failed before enrich awaited it.
+        info_task.cancel()
+    info.release()
+
+
+async def compare_prices_response(ctx: discord.ApplicationContext, game_names: list):
+    """Responds with one embed comparing several games. Plains, overviews,
+    info and key prices are each fetched in a single batched call, so the
+    number of round trips does not grow with the number of games."""
+    await ctx.response.defer()
+    region = ServerSettings.get_region(ctx.guild.id)
+    titles = []
+    for game_name in game_names[:MAX_COMPARED_GAMES]:
+        names = get_closest_names(game_name.replace("'", "''"))
+        if names and names[0] not in titles:
+            titles.append(names[0])
+    appids = get_steam_appids(titles) if titles else {}
+    steam_ids = [appid for appid in appids.values() if appid]
+    plains = await fetch_itad_plains_by_steam_ids(steam_ids) if steam_ids else {}
+    title_plains = {
+        title: plains[appids[title]] for title in titles if appids.get(title) in plains
+    }
+    if not title_plains:
+        await ctx.respond("None of these games could be found.", ephemeral=True)
+        return
+    overviews, infos = await asyncio.gather(
+        fetch_itad_overview(list(title_plains.values()), region),
+        fetch_itad_info(list(title_plains.values())),
+    )
+    key_prices = await asyncio.to_thread(get_key_prices, list(title_plains))
+    await price_history.preload_async(list(title_plains.values()), region)
+
+    embed = discord.Embed(title="Price Comparison")
+    for title, plain in title_plains.items():
+        info = PriceInfo(
+            plain, overviews.get(plain) or {}, infos.get(plain) or {}, region
+        )
+        values = {
+            "Current": f"`{info.price}({info.price_cut})` at "
+            f"[{info.price_store}]({info.price_url})",
+            "Lowest": f"`{info.lowest_price}({info.lowest_cut})` at "
+            f"[{info.lowest_store}]({info.lowest_url})",
+        }
+        values.update(price_history.summary(plain, region))
+        if key_prices.get(title):
+            values["Key"] = key_price_str(key_prices[title])
+        field = embed_listed_field(info.itad_info.get("title", title), values)
+        field.inline = False
+        embed.append_field(field)
+    missing = [title for title in titles if title not in title_plains]
+    if missing:
+        embed.set_footer(text=f"Not found on ITAD: {', '.join(missing)}"[:2000])
+    embed.append_field(embed_cta())
+    await ctx.respond(embed=embed)
+
+
+def get_key_prices(game_names: list[str]) -> dict:
+    """Finds a global steam G2A key for each game name in one query."""
+    with read_session() as session:
+        stmt = select(G2AData).where(
+            or_(*[G2AData.title.like(f"%{name}%") for name in game_names])
+            & (G2AData.region == "GLOBAL")
+            & (G2AData.platform == "Steam")
+        )
+        results = session.execute(stmt).scalars().all()
+    key_prices = {}
+    for name in game_names:
+        matches = [result for result in results if name in result.title]
+        if matches:
+            key_prices[name] = min(matches, key=lambda result: result.minprice)
+    return key_prices
+
+
+def key_price_str(result: G2AData) -> str:
+    url = f"https://www.g2a.com{result.slug}?gtag=08045ab515"
+    price = "${:.2f}".format(result.minprice)
+    return f"`{price}` at [G2A]({url})"
+
+
+# Closest steam app of each title in :titles, in one trigram query.
+CLOSEST_APPIDS = text(
+    """SELECT t.title, m.appid
+    FROM unnest(CAST(:titles AS varchar[])) AS t(title)
+    CROSS JOIN LATERAL (
+        SELECT appid FROM steam_apps
+        WHERE name % t.title
+        ORDER BY name <-> t.title
+        LIMIT 1
+    ) m"""
+)
 
 
-async def get_itad_overviews(plains: list[str]) -> dict:
+def get_steam_appids(titles: list[str]) -> dict[str, int]:
+    """Matches game titles to steam app ids. Exact names are matched in one
+    query and the rest through their closest steam app name in a second."""
+    with Session() as session:
+        stmt = select(SteamApps.name, SteamApps.appid).where(SteamApps.name.in_(titles))
+        appids = dict(session.execute(stmt).all())
+        unmatched = [title for title in dict.fromkeys(titles) if title not in appids]
+        if unmatched:
+            closest = session.execute(CLOSEST_APPIDS, {"titles": unmatched})
+            appids.update(closest.all())
+    return appids
+
+
+async def get_itad_plains(app_ids: list[int]) -> dict:
+    """Maps steam app ids to ITAD game plains, 100 ids per request."""
+    all_plains = {}
+    for i in range(0, len(app_ids), 100):
+        plains = await fetch_itad_plains_by_steam_ids(app_ids[i : i + 100])
+        all_plains.update(plains)
+    return all_plains
+
+
+async def get_itad_infos(plains: list[str]) -> dict:
+    """Creates a dict of ITAD info where all input game plains are keys."""
+    all_info = {}
+    for i in range(0, len(plains), 20):
+        info = await fetch_itad_info(plains[i : i + 20])
+        all_info.update(info)
+    return all_info
+
+
+async def get_itad_overviews(plains: list[str], region: str = DEFAULT_REGION) -> dict:
     """Creates a dict where all input game plains are keys. Used to check
     active price alerts."""
     all_overviews = {}
     for i in range(0, len(plains), 20):
-        overviews = await fetch_itad_overview(plains[i : i + 20])
+        overviews = await fetch_itad_overview(plains[i : i + 20], region)
         all_overviews.update(overviews)
     return all_overviews
 
@@ -145,8 +378,15 @@ def price_comparison(alert: PriceAlerts, info: dict) -> bool:
 
 
 class PriceInfo:
-    def __init__(self, game_plain: str, itad_overview: dict, itad_info: dict):
+    def __init__(
+        self,
+        game_plain: str,
+        itad_overview: dict,
+        itad_info: dict,
+        region: str = DEFAULT_REGION,
+    ):
         self.game_plain = game_plain
+        self.region = region
 
         # Parsing ITAD overview
         self.itad_overview = itad_overview
@@ -162,37 +402,72 @@ class PriceInfo:
         self.lowest_url = self.lowest.get("url", "None")
 
         # Parsing ITAD info
+        self.set_info(itad_info)
+        self.key_field = None
+
+    def set_info(self, itad_info: dict) -> None:
         self.itad_info = itad_info
         self.game_name = itad_info.get("title", "None")
         self.image = itad_info.get("image")
 
     @staticmethod
-    async def create_one(game_plain: str):
-        itad_overview = await fetch_itad_overview(game_plain)
+    async def create_one(game_plain: str, region: str = DEFAULT_REGION):
+        itad_overview = await fetch_itad_overview(game_plain, region)
         itad_info = await fetch_itad_info(game_plain)
         itad_overview = itad_overview[game_plain]
         itad_info = itad_info[game_plain]
-        self = PriceInfo(game_plain, itad_overview, itad_info)
+        self = PriceInfo(game_plain, itad_overview, itad_info, region)
         if not self.image:
             self.image = await get_steam_image(self.game_name)
+        self.key_field = self._key_field()
         return self
 
-    def _key_field(self) -> discord.EmbedField:
+    async def enrich(self, ctx: discord.ApplicationContext, info_task: asyncio.Task):
+        """Fills in the ITAD info, image and key price, each within its own
+        deadline, and edits the response whenever one of them resolves."""
+
+        async def load_info():
+            itad_info = await asyncio.wait_for(info_task, INFO_TIMEOUT)
+            self.set_info({"title": self.game_name, **itad_info[self.game_plain]})
+            if not self.image:
+                image = get_steam_image(self.game_name)
+                self.image = await asyncio.wait_for(image, IMAGE_TIMEOUT)
+
+        # load_info renames the game while the key price query runs in a
+        # thread, so the query gets the name it started with.
+        game_name = self.game_name
+
+        async def load_key_field():
+            key_field = asyncio.to_thread(self._key_field, game_name)
+            self.key_field = await asyncio.wait_for(key_field, KEY_PRICE_TIMEOUT)
+
+        for step in asyncio.as_completed([load_info(), load_key_field()]):
+            try:
+                await step
+            except Exception:
+                continue
+            await ctx.edit(embed=self.info_embed())
+
+    def release(self) -> None:
+        """Drops the raw ITAD responses once the embed is final. The view of
+        a price lookup keeps its PriceInfo alive until it times out."""
+        self.itad_overview = self.itad_info = None
+        self.current = self.lowest = None
+
+    def _key_field(self, game_name: str = None) -> discord.EmbedField:
+        game_name = game_name or self.game_name
         with Session() as session:
             result = (
                 session.query(G2AData)
                 .filter(
-                    (G2AData.title.like(f"%{self.game_name}%"))
+                    (G2AData.title.like(f"%{game_name}%"))
                     & (G2AData.region == "GLOBAL")
                     & (G2AData.platform == "Steam")
                 )
                 .first()
             )
         if result:
-            url = f"https://www.g2a.com{result.slug}?gtag=08045ab515"
-            price = "${:.2f}".format(result.minprice)
-            price_str = f"`{price}` at [G2A]({url})"
-            return embed_listed_field("Key Price", price_str)
+            return embed_listed_field("Key Price", key_price_str(result))
         else:
             return None
 
@@ -200,8 +475,9 @@ class PriceInfo:
         embed = discord.Embed(title=self.game_name)
         current_str = f"`{self.price}({self.price_cut})` at [{self.price_store}]({self.price_url})"
         lowest_str = f"`{self.lowest_price}({self.lowest_cut})` at [{self.lowest_store}]({self.lowest_url})"
-        key_field = self._key_field()
+        key_field = self.key_field
         price_info = {"Current Price": current_str, "Lowest Price": lowest_str}
+        price_info.update(price_history.summary(self.game_plain, self.region))
         embed.append_field(embed_listed_field("Store Price", price_info))
         if key_field:
             embed.append_field(key_field)
@@ -212,9 +488,11 @@ class PriceInfo:
 
     @staticmethod
     def alert_embed(alert: PriceAlerts, overview: dict) -> discord.Embed:
-        self = PriceInfo(alert.game_plain, overview, {})
+        region = alert.region or DEFAULT_REGION
+        self = PriceInfo(alert.game_plain, overview, {}, region)
+        self.key_field = self._key_field()
         embed = self.info_embed()
-        embed.title = f"{alert.game_name} under ${alert.price}"
+        embed.title = f"{alert.game_name} under {format_price(alert.price, region)}"
         embed.set_image(url=alert.image_url)
         embed.color = alert_color
         return embed
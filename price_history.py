@@ -0,0 +1,196 @@
+import asyncio
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+
+from bot import LOW_MEMORY
+from models import Session, PriceHistory, DEFAULT_REGION, format_price
+
+# How much history is kept in memory for each plain.
+HISTORY_WINDOW = timedelta(days=90)
+# Windows kept in memory. The least recently used are dropped beyond this
+# and loaded again from the table when they are next needed.
+MAX_WINDOWS = 2_000 if LOW_MEMORY else 20_000
+
+
+class PriceObservation:
+    __slots__ = ("time", "price", "cut", "store")
+
+    def __init__(self, time: datetime, price_cents: int, cut: int, store: str):
+        self.time = time
+        self.price = price_cents / 100
+        self.cut = cut
+        self.store = store
+
+
+class PriceHistoryStore:
+    """Append-only price history filled by the price_alert sweep.
+
+    Every change of the observed current price is written to the
+    price_history table and kept in an in-memory window per region and
+    plain, so lowest-in-N-days and trend data can be shown without extra
+    ITAD calls. At most max_windows windows are kept, least recently used
+    first out."""
+
+    def __init__(self, window: timedelta = HISTORY_WINDOW, max_windows=MAX_WINDOWS):
+        self.window = window
+        self.max_windows = max_windows
+        self.recent = OrderedDict()
+
+    def _store(self, key: tuple, observations: deque) -> None:
+        self.recent[key] = observations
+        while len(self.recent) > self.max_windows:
+            self.recent.popitem(last=False)
+
+    def _append(self, key: tuple, observation: PriceObservation) -> None:
+        recent = self.recent[key]
+        recent.append(observation)
+        cutoff = datetime.now() - self.window
+        while recent and recent[0].time < cutoff:
+            recent.popleft()
+
+    def _changed(self, key: tuple, row: dict) -> bool:
+        window = self.recent.get(key)
+        if not window:
+            return True
+        last = window[-1]
+        return (round(last.price * 100), last.cut, last.store) != (
+            row["price_cents"],
+            row["cut"],
+            row["store"],
+        )
+
+    def record_overviews(
+        self, overviews: dict, region: str = DEFAULT_REGION, when: datetime = None
+    ) -> None:
+        """Stores the current price of every plain in an ITAD overview
+        response, unless it is the same as the last observation in its
+        loaded window. Windows that are not loaded always get a row."""
+        when = when or datetime.now()
+        rows = []
+        for plain, overview in overviews.items():
+            current = (overview or {}).get("price") or {}
+            if current.get("price") is None:
+                continue
+            row = {
+                "plain": plain,
+                "region": region,
+                "time": when,
+                "price_cents": round(current["price"] * 100),
+                "cut": current.get("cut", 0),
+                "store": current.get("store"),
+            }
+            if self._changed((region, plain), row):
+                rows.append(row)
+        if not rows:
+            return
+        with Session() as session:
+            session.execute(insert(PriceHistory), rows)
+            session.commit()
+        for row in rows:
+            key = (region, row["plain"])
+            if key in self.recent:
+                self._append(
+                    key,
+                    PriceObservation(
+                        when, row["price_cents"], row["cut"], row["store"]
+                    ),
+                )
+
+    def _missing(self, plains: list[str], region: str) -> list[str]:
+        """Plains without a window in memory. The others are marked as used."""
+        missing = []
+        for plain in plains:
+            if (region, plain) in self.recent:
+                self.recent.move_to_end((region, plain))
+            else:
+                missing.append(plain)
+        return missing
+
+    def _query(self, plains: list[str], region: str) -> list[tuple]:
+        cutoff = datetime.now() - self.window
+        with Session() as session:
+            stmt = (
+                select(
+                    PriceHistory.plain,
+                    PriceHistory.time,
+                    PriceHistory.price_cents,
+                    PriceHistory.cut,
+                    PriceHistory.store,
+                )
+                .where(
+                    PriceHistory.plain.in_(plains)
+                    & (PriceHistory.region == region)
+                    & (PriceHistory.time >= cutoff)
+                )
+                .order_by(PriceHistory.time)
+            )
+            return session.execute(stmt).all()
+
+    def _load_rows(self, plains: list[str], region: str, rows: list[tuple]) -> None:
+        windows = {plain: deque() for plain in plains}
+        for plain, *observation in rows:
+            windows[plain].append(PriceObservation(*observation))
+        for plain, observations in windows.items():
+            self._store((region, plain), observations)
+
+    def preload(self, plains: list[str], region: str = DEFAULT_REGION) -> None:
+        """Loads the windows of many plains of a region in one query."""
+        plains = self._missing(plains, region)
+        if plains:
+            self._load_rows(plains, region, self._query(plains, region))
+
+    async def preload_async(
+        self, plains: list[str], region: str = DEFAULT_REGION
+    ) -> None:
+        """Like preload, with the query in a worker thread. Used by interactive
+        lookups, which must not block the event loop."""
+        plains = self._missing(plains, region)
+        if plains:
+            rows = await asyncio.to_thread(self._query, plains, region)
+            self._load_rows(plains, region, rows)
+
+    def window_for(self, plain: str, region: str = DEFAULT_REGION) -> deque:
+        """Returns the recent observations of a plain, loading them once."""
+        self.preload([plain], region)
+        return self.recent.get((region, plain), deque())
+
+    def _since(self, plain: str, region: str, days: int) -> list[PriceObservation]:
+        """Observations of the last number of days. Only changes are stored,
+        so the observation still in effect at the cutoff is included."""
+        cutoff = datetime.now() - timedelta(days=days)
+        window = self.window_for(plain, region)
+        observations = [obs for obs in window if obs.time >= cutoff]
+        earlier = len(window) - len(observations)
+        if earlier:
+            observations.insert(0, window[earlier - 1])
+        return observations
+
+    def lowest(self, plain: str, region: str, days: int) -> PriceObservation:
+        """The lowest observed price within the last number of days."""
+        observations = self._since(plain, region, days)
+        return min(observations, key=lambda obs: obs.price, default=None)
+
+    def trend(self, plain: str, region: str, days: int) -> float:
+        """Relative price change over the last number of days, or None."""
+        observations = self._since(plain, region, days)
+        if len(observations) < 2 or not observations[0].price:
+            return None
+        return observations[-1].price / observations[0].price - 1
+
+    def summary(self, plain: str, region: str = DEFAULT_REGION, days: int = 30):
+        """Embed-ready lowest and trend values for a plain."""
+        values = {}
+        lowest = self.lowest(plain, region, days)
+        if lowest:
+            price = format_price(round(lowest.price, 2), region)
+            values[f"Lowest ({days}d)"] = f"{price}(-{lowest.cut}%) at {lowest.store}"
+        trend = self.trend(plain, region, days)
+        if trend is not None:
+            arrow = "▲" if trend > 0 else "▼" if trend < 0 else "="
+            values[f"Trend ({days}d)"] = f"{arrow} {abs(trend):.0%}"
+        return values
+
+
+price_history = PriceHistoryStore()
@@ -0,0 +1,151 @@
+import contextvars
+import functools
+import re
+import sys
+import traceback
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from diagnostics import repo_site
+
+_current_run = contextvars.ContextVar("sql_profile_run", default=None)
+
+
+def fingerprint(statement: str) -> str:
+    """Normalizes a statement so calls that only differ in literals match."""
+    statement = re.sub(r"'(?:[^']|'')*'", "?", statement)
+    statement = re.sub(r"\b\d+(\.\d+)?\b", "?", statement)
+    statement = re.sub(r"\(\s*\?(\s*,\s*\?)*\s*\)", "(?...)", statement)
+    return " ".join(statement.split())
+
+
+def call_site() -> str:
+    """Finds the innermost frame of this repository that issued the query."""
+    frames = (
+        (frame.f_code.co_filename, lineno, frame.f_code.co_name)
+        for frame, lineno in traceback.walk_stack(sys._getframe(1))
+    )
+    return repo_site(frames, skip=(__file__,)) or "unknown"
+
+
+class QueryStats:
+    """Count, total and recent durations for one statement or call site."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.durations = deque(maxlen=1000)
+
+    def add(self, duration: float) -> None:
+        self.count += 1
+        self.total += duration
+        self.durations.append(duration)
+
+    @property
+    def p99(self) -> float:
+        durations = sorted(self.durations)
+        return durations[int(0.99 * (len(durations) - 1))] if durations else 0.0
+
+
+class QueryProfiler:
+    """Times every statement through SQLAlchemy engine events and groups the
+    timings by statement fingerprint and by the Python call site. Within a
+    profiled run, statements repeated at the same call site are flagged as
+    likely N+1 patterns."""
+
+    def __init__(self, repeat_threshold: int = 5):
+        self.repeat_threshold = repeat_threshold
+        self.enabled = False
+        self.engines = []
+        self.statements = defaultdict(QueryStats)
+        self.call_sites = defaultdict(QueryStats)
+        self.repeats = {}
+
+    def install(self, engine) -> None:
+        """Attaches the profiler to an engine. Safe to call more than once."""
+        self.enabled = True
+        if engine in self.engines:
+            return
+        self.engines.append(engine)
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+
+    def reset(self) -> None:
+        self.statements.clear()
+        self.call_sites.clear()
+        self.repeats.clear()
+
+    def _before_execute(self, conn, cursor, statement, params, context, many):
+        if self.enabled:
+            conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, params, context, many):
+        starts = conn.info.get("query_start")
+        if not self.enabled or not starts:
+            return
+        duration = time.perf_counter() - starts.pop()
+        statement = fingerprint(statement)
+        site = call_site()
+        self.statements[statement].add(duration)
+        self.call_sites[site].add(duration)
+        run = _current_run.get()
+        if run is not None:
+            run[1][(site, statement)] += 1
+
+    @contextmanager
+    def run(self, name: str):
+        """Groups the statements of one task run or command invocation."""
+        token = _current_run.set((name, Counter()))
+        try:
+            yield
+        finally:
+            name, counts = _current_run.get()
+            _current_run.reset(token)
+            for (site, statement), count in counts.items():
+                if count >= self.repeat_threshold:
+                    key = (name, site, statement)
+                    self.repeats[key] = max(count, self.repeats.get(key, 0))
+
+    def track(self, name: str = None):
+        """Decorator that profiles each call of a coroutine as one run."""
+
+        def wrapper(func):
+            @functools.wraps(func)
+            async def wrapped(*args, **kwargs):
+                with self.run(name or func.__name__):
+                    return await func(*args, **kwargs)
+
+            return wrapped
+
+        return wrapper
+
+    def report(self, limit: int = 10) -> str:
+        """Formats the slowest call sites, statements and repeated queries."""
+        if not self.enabled:
+            return "SQL profiler is disabled."
+        lines = ["Call sites (count | total ms | p99 ms):"]
+        sites = sorted(self.call_sites.items(), key=lambda i: -i[1].total)
+        for site, stats in sites[:limit]:
+            lines.append(
+                f"{stats.count} | {stats.total * 1000:.0f} | "
+                f"{stats.p99 * 1000:.1f} | {site}"
+            )
+        lines.append("\nStatements (count | total ms | p99 ms):")
+        statements = sorted(self.statements.items(), key=lambda i: -i[1].total)
+        for statement, stats in statements[:limit]:
+            lines.append(
+                f"{stats.count} | {stats.total * 1000:.0f} | "
+                f"{stats.p99 * 1000:.1f} | {statement[:80]}"
+            )
+        if self.repeats:
+            lines.append("\nRepeated within one run (possible N+1):")
+            repeats = sorted(self.repeats.items(), key=lambda i: -i[1])
+            for (name, site, statement), count in repeats[:limit]:
+                lines.append(f"{count}x in {name} | {site} | {statement[:60]}")
+        return "\n".join(lines)
+
+
+profiler = QueryProfiler()
@@ -0,0 +1,103 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from metrics import metrics
+
+# Priority classes, lower values are served first.
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+request_priority = contextvars.ContextVar("request_priority", default=BACKGROUND)
+
+
+@contextmanager
+def interactive():
+    """Marks upstream calls made inside the block as interactive."""
+    token = request_priority.set(INTERACTIVE)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+class RequestBudget:
+    """Token bucket for one upstream API.
+
+    Requests take a token when one is available and nobody is queued.
+    Otherwise they wait in a priority queue, so interactive requests always
+    go ahead of queued background traffic and background sweeps only use
+    the capacity that is left."""
+
+    def __init__(self, name: str, rate: float, capacity: int):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.waiters = []
+        self._counter = itertools.count()
+        self._timer = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _schedule(self) -> None:
+        if self._timer is None and self.waiters:
+            delay = max((1 - self.tokens) / self.rate, 0)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._release)
+
+    def _release(self) -> None:
+        self._timer = None
+        self._refill()
+        while self.waiters and self.tokens >= 1:
+            _, _, future = heapq.heappop(self.waiters)
+            if future.done():
+                continue
+            self.tokens -= 1
+            future.set_result(None)
+        self._schedule()
+
+    async def acquire(self, priority: int = None) -> None:
+        """Waits for a token at the given or the current context's priority."""
+        if priority is None:
+            priority = request_priority.get()
+        start = time.monotonic()
+        self._refill()
+        if not self.waiters and self.tokens >= 1:
+            self.tokens -= 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self.waiters, (priority, next(self._counter), future))
+            self._schedule()
+            await future
+        label = f"budget.{self.name}.{PRIORITY_NAMES[priority]}"
+        metrics.inc(f"{label}.requests")
+        metrics.observe(f"{label}.queue_delay", time.monotonic() - start)
+        metrics.gauge(f"budget.{self.name}.tokens", self.tokens)
+        metrics.gauge(f"budget.{self.name}.queued", len(self.waiters))
+
+
+budgets = {
+    "api.isthereanydeal.com": RequestBudget(
+        "itad", float(os.getenv("ITAD_RATE", 5)), int(os.getenv("ITAD_BURST", 10))
+    ),
+    "store.steampowered.com": RequestBudget(
+        "steam", float(os.getenv("STEAM_RATE", 0.6)), int(os.getenv("STEAM_BURST", 20))
+    ),
+}
+
+
+async def acquire_for(url: str) -> None:
+    """Waits for the budget of the API host of a url, if it has one."""
+    budget = budgets.get(urlparse(url).hostname)
+    if budget:
+        await budget.acquire()
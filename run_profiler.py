@@ -0,0 +1,162 @@
+import asyncio
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+
+import discord
+
+from bot import bot
+
+SAMPLE_INTERVAL = 0.005
+MODES = ("sampling", "cprofile")
+
+
+def code_chain(func) -> set:
+    """Code objects of a function and of everything it wraps."""
+    codes = set()
+    while func is not None:
+        if hasattr(func, "__code__"):
+            codes.add(func.__code__)
+        func = getattr(func, "__wrapped__", None)
+    return codes
+
+
+def frame_name(code) -> str:
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+class StackSampler:
+    """Samples the stack of the event loop thread from a background thread.
+
+    Samples are kept as collapsed stacks, the input format of flamegraph
+    tools. Stacks that pass through the profiled function are rooted at the
+    run name and everything else the loop did meanwhile at [other]. Samples
+    of the idle loop waiting in its selector are dropped."""
+
+    def __init__(self, name: str, codes: set, interval: float = SAMPLE_INTERVAL):
+        self.name = name
+        self.codes = codes
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None or frame.f_code.co_filename.endswith("selectors.py"):
+                continue
+            names, inside = [], False
+            while frame:
+                inside = inside or frame.f_code in self.codes
+                names.append(frame_name(frame.f_code))
+                frame = frame.f_back
+            root = self.name if inside else "[other]"
+            self.stacks[";".join([root, *reversed(names)])] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.items())
+
+    def hottest(self, limit: int = 10) -> list[tuple]:
+        """Innermost frames of the run ranked by their sample count."""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            if stack.startswith(f"{self.name};"):
+                leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(limit)
+
+
+class RunProfiler:
+    """Profiles the next run of a named task, deadline handler or command on
+    request, and sends the result to the profile channel.
+
+    Sampling is cheap enough for production. cProfile traces every call on
+    the loop thread while the run is active, including other coroutines that
+    interleave with it, and additionally produces a pstats file."""
+
+    def __init__(self):
+        self.armed = {}
+        self.active = False
+
+    def arm(self, name: str, mode: str = "sampling") -> None:
+        self.armed[name] = mode
+
+    @contextmanager
+    def capture(self, name: str, func=None):
+        """Profiles the wrapped block if the name is armed."""
+        if name not in self.armed or self.active:
+            yield
+            return
+        mode = self.armed.pop(name)
+        self.active = True
+        sampler = StackSampler(name, code_chain(func))
+        profile = cProfile.Profile() if mode == "cprofile" else None
+        start = time.perf_counter()
+        sampler.start()
+        if profile:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+            sampler.stop()
+            self.active = False
+            duration = time.perf_counter() - start
+            asyncio.get_running_loop().create_task(
+                self._send(name, mode, duration, sampler, profile)
+            )
+
+    async def _send(self, name, mode, duration, sampler, profile) -> None:
+        samples = sum(sampler.stacks.values())
+        in_run = sum(count for _, count in sampler.hottest(None))
+        lines = [
+            f"Profile of {name} ({mode}): {duration:.2f}s wall, "
+            f"{samples} busy loop samples, {in_run} in the run."
+        ]
+        lines += [f"{count:>6} {frame}" for frame, count in sampler.hottest()]
+        # Names are prefixed with their kind, the colon is kept out of files.
+        filename = name.replace(":", "_")
+        files = [
+            discord.File(io.BytesIO(sampler.collapsed().encode()), f"{filename}.folded")
+        ]
+        if profile:
+            profile.create_stats()
+            files.append(
+                discord.File(
+                    io.BytesIO(marshal.dumps(profile.stats)), f"{filename}.pstats"
+                )
+            )
+            stream = io.StringIO()
+            stats = pstats.Stats(profile, stream=stream)
+            stats.sort_stats("cumulative").print_stats(30)
+            files.append(
+                discord.File(io.BytesIO(stream.getvalue().encode()), f"{filename}.txt")
+            )
+        summary = "\n".join(lines)[:1900]
+        try:
+            channel = await bot.fetch_channel(bot.profile_channel)
+            await channel.send(f"```{summary}```", files=files)
+        except Exception:
+            traceback.print_exc()
+
+
+run_profiler = RunProfiler()
@@ -0,0 +1,135 @@
+import asyncio
+import heapq
+import itertools
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from diagnostics import report_exception
+from run_profiler import run_profiler
+
+
+class DeadlineScheduler:
+    """Keeps upcoming deadlines from the database in a heap and sleeps until
+    exactly the next one is due, instead of polling tables on a fixed loop.
+
+    Each deadline kind has a loader returning the pending (key, deadline)
+    pairs, a version function returning a cheap fingerprint of the pending
+    rows and a handler coroutine that is awaited once per wakeup when any
+    deadline of that kind is due. Rows a handler leaves pending, because it
+    failed or had nothing to do yet, are retried after retry_minutes."""
+
+    def __init__(self, refresh_minutes: int = 10, retry_minutes: int = 5):
+        self.refresh_interval = timedelta(minutes=refresh_minutes)
+        self.retry_interval = timedelta(minutes=retry_minutes)
+        self._heap = []
+        self._scheduled = {}
+        self._counter = itertools.count()
+        self._kinds = {}
+        self._versions = {}
+        self._last_refresh = datetime.min
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def register(
+        self,
+        kind: str,
+        handler: Callable[[], Awaitable[None]],
+        loader: Callable[[], list[tuple]],
+        version: Callable[[], tuple],
+    ) -> None:
+        """Registers a deadline kind with its handler, loader and version check."""
+        self._kinds[kind] = (handler, loader, version)
+
+    def schedule(self, kind: str, key, when: datetime) -> None:
+        """Adds a single deadline. Used when a row is created by the bot itself,
+        so it does not have to wait for the next refresh."""
+        if when is None:
+            return
+        whens = self._scheduled.setdefault((kind, key), set())
+        if when in whens:
+            return
+        whens.add(when)
+        heapq.heappush(self._heap, (when, next(self._counter), kind, key))
+        self._wakeup.set()
+
+    def load(self, kind: str, retry_at: datetime = None) -> None:
+        """Schedules the pending deadlines of a kind. Deadlines that already
+        passed are skipped while their key is still scheduled, for a retry or
+        by the handler itself. With retry_at, the others are moved there
+        instead of being due again."""
+        loader = self._kinds[kind][1]
+        now = datetime.now()
+        for key, when in loader():
+            if when is not None and when <= now:
+                if self._scheduled.get((kind, key)):
+                    continue
+                when = retry_at or when
+            self.schedule(kind, key, when)
+
+    def refresh(self, force: bool = False) -> None:
+        """Reloads the deadlines of every kind whose version changed."""
+        for kind, (_, _, version) in self._kinds.items():
+            current = version()
+            if not force and self._versions.get(kind) == current:
+                continue
+            self._versions[kind] = current
+            self.load(kind)
+        self._last_refresh = datetime.now()
+
+    def _pop_due(self) -> set[str]:
+        """Removes all deadlines that have passed and returns their kinds."""
+        due = set()
+        now = datetime.now()
+        while self._heap and self._heap[0][0] <= now:
+            when, _, kind, key = heapq.heappop(self._heap)
+            whens = self._scheduled[(kind, key)]
+            whens.discard(when)
+            if not whens:
+                del self._scheduled[(kind, key)]
+            due.add(kind)
+        return due
+
+    async def _sleep(self) -> None:
+        """Sleeps until the next deadline, the next refresh or a new schedule."""
+        next_refresh = self._last_refresh + self.refresh_interval
+        wake_at = min(self._heap[0][0], next_refresh) if self._heap else next_refresh
+        timeout = max((wake_at - datetime.now()).total_seconds(), 0)
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self) -> None:
+        force = True
+        while True:
+            if force or datetime.now() >= self._last_refresh + self.refresh_interval:
+                try:
+                    self.refresh(force=force)
+                    force = False
+                except Exception:
+                    self._last_refresh = datetime.now()
+                    await report_exception("Scheduler error (refresh)")
+            for kind in self._pop_due():
+                handler = self._kinds[kind][0]
+                try:
+                    name = f"deadline:{handler.__name__}"
+                    with run_profiler.capture(name, handler):
+                        await handler()
+                except Exception:
+                    await report_exception(f"Scheduler error ({kind})")
+                # The version may not change when the handler failed or left
+                # rows pending, so those are rescheduled here.
+                try:
+                    self.load(kind, retry_at=datetime.now() + self.retry_interval)
+                except Exception:
+                    await report_exception(f"Scheduler error ({kind} reschedule)")
+            await self._sleep()
+
+    def handlers(self) -> list[Callable[[], Awaitable[None]]]:
+        return [handler for handler, _, _ in self._kinds.values()]
+
+    def start(self) -> None:
+        """Starts the scheduler. Safe to call again on reconnects."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
@@ -0,0 +1,28 @@
+import time
+
+_start = time.perf_counter()
+marks = {}
+
+
+def mark(stage: str) -> None:
+    """Records the seconds since process start at which a startup stage
+    finished. Only the first occurrence of a stage is kept."""
+    if stage not in marks:
+        marks[stage] = time.perf_counter() - _start
+
+
+def report() -> str:
+    """Formats the recorded stages along with the time each one took."""
+    lines = []
+    previous = 0.0
+    for stage, elapsed in sorted(marks.items(), key=lambda item: item[1]):
+        lines.append(f"{stage}: {elapsed:.2f}s (+{elapsed - previous:.2f}s)")
+        previous = elapsed
+    return "\n".join(lines)
+
+
+def first_tick() -> None:
+    """Marks the first alert loop tick and prints the startup report once."""
+    if "first_loop_tick" not in marks:
+        mark("first_loop_tick")
+        print(f"Startup timing:\n{report()}")
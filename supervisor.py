@@ -0,0 +1,128 @@
+import asyncio
+import random
+import time
+from datetime import datetime
+
+from diagnostics import exception_block, report
+from metrics import metrics
+from run_profiler import run_profiler
+
+# Seconds before the first retry after a failed run, doubled on each failure.
+BACKOFF_START = 30
+
+supervised_tasks = []
+
+
+class SupervisedTask:
+    """A periodic background job that replaces discord.ext.tasks.loop.
+
+    A run is skipped while the previous one is still going, every run has a
+    time budget, the first run is delayed by a random jitter so the jobs do
+    not all start at once, and failures are reported and retried with
+    exponential backoff instead of stopping the loop."""
+
+    def __init__(self, coro, interval: float, jitter: float, timeout: float):
+        self.coro = coro
+        self.name = coro.__name__
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self.running = False
+        self.failures = 0
+        self.last_success = None
+        self.last_duration = None
+        self._task = None
+        supervised_tasks.append(self)
+
+    async def __call__(self, *args, **kwargs) -> bool:
+        """Runs the job now unless it is already running. Returns whether
+        the run completed successfully."""
+        if self.running:
+            metrics.inc(f"task.{self.name}.skipped")
+            return False
+        self.running = True
+        start = time.monotonic()
+        try:
+            with run_profiler.capture(f"task:{self.name}", self.coro):
+                await asyncio.wait_for(self.coro(*args, **kwargs), self.timeout)
+            self.failures = 0
+            self.last_success = datetime.now()
+            return True
+        except Exception as exc:
+            self.failures += 1
+            metrics.inc(f"task.{self.name}.failures")
+            await self._report(exc)
+            return False
+        finally:
+            self.running = False
+            self.last_duration = time.monotonic() - start
+            metrics.observe(f"task.{self.name}.duration", self.last_duration)
+
+    async def _report(self, exc: Exception) -> None:
+        if isinstance(exc, asyncio.TimeoutError):
+            details = f"Run exceeded its {self.timeout:.0f}s budget."
+        else:
+            details = exception_block()
+        await report(f"Task error ({self.name}, failure {self.failures}):\n{details}")
+
+    def next_delay(self) -> float:
+        """The regular interval, or a shorter backoff after failures."""
+        if not self.failures:
+            return self.interval
+        return min(self.interval, BACKOFF_START * 2 ** (self.failures - 1))
+
+    async def _loop(self) -> None:
+        await asyncio.sleep(random.uniform(0, self.jitter))
+        while True:
+            start = time.monotonic()
+            await self()
+            await asyncio.sleep(max(self.next_delay() - (time.monotonic() - start), 0))
+
+    def _restart(self, task: asyncio.Task) -> None:
+        """Restarts the loop if it ever stops on an unexpected error."""
+        if task.cancelled() or task.exception() is None:
+            return
+        self.failures += 1
+        metrics.inc(f"task.{self.name}.restarts")
+        asyncio.get_running_loop().call_later(self.next_delay(), self.start)
+
+    def start(self) -> None:
+        """Starts the loop. Safe to call again on reconnects."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+            self._task.add_done_callback(self._restart)
+
+    def cancel(self) -> None:
+        if self._task:
+            self._task.cancel()
+
+    def status(self) -> str:
+        last = self.last_success.strftime("%m-%d %H:%M") if self.last_success else "never"
+        duration = f"{self.last_duration:.1f}s" if self.last_duration is not None else "-"
+        state = "running" if self.running else "idle"
+        return (
+            f"{self.name}: {state} | last success {last} | "
+            f"last run {duration} | failures {self.failures}"
+        )
+
+
+def supervised(
+    *,
+    seconds: float = 0,
+    minutes: float = 0,
+    hours: float = 0,
+    jitter: float = 60,
+    timeout: float = None,
+):
+    """Decorator creating a SupervisedTask. The run budget defaults to the
+    interval, so a run can never overlap the next scheduled one."""
+
+    def wrapper(coro) -> SupervisedTask:
+        interval = seconds + minutes * 60 + hours * 3600
+        return SupervisedTask(coro, interval, min(jitter, interval), timeout or interval)
+
+    return wrapper
+
+
+def tasks_status() -> str:
+    return "\n".join(task.status() for task in supervised_tasks)
@@ -0,0 +1,50 @@
+import random
+from collections import Counter
+
+import discord
+
+from alerts import (
+    pack_embeds,
+    pick_winners,
+    MAX_EMBEDS_PER_MESSAGE,
+    MAX_EMBED_CHARS_PER_MESSAGE,
+)
+
+
+def test_messages_hold_at_most_ten_embeds():
+    embeds = [discord.Embed(title=f"Game {i}") for i in range(23)]
+    messages = pack_embeds(embeds)
+    assert [len(message) for message in messages] == [10, 10, 3]
+    assert [embed for message in messages for embed in message] == embeds
+
+
+def test_messages_stay_under_the_character_limit():
+    embeds = [discord.Embed(description="x" * 2500) for _ in range(5)]
+    messages = pack_embeds(embeds)
+    assert [len(message) for message in messages] == [2, 2, 1]
+    for message in messages:
+        assert len(message) <= MAX_EMBEDS_PER_MESSAGE
+        assert sum(len(embed) for embed in message) <= MAX_EMBED_CHARS_PER_MESSAGE
+
+
+def test_no_embeds_make_no_messages():
+    assert pack_embeds([]) == []
+
+
+def test_winners_are_distinct_while_voters_are_left():
+    voter_ids = [1, 1, 1, 2, 3]
+    for _ in range(50):
+        winners = pick_winners(voter_ids, 3)
+        assert sorted(winners) == [1, 2, 3]
+
+
+def test_more_giveaways_than_voters_reuse_voters():
+    winners = pick_winners([7, 8], 5)
+    assert len(winners) == 5 and set(winners) == {7, 8}
+    assert sorted(winners[:2]) == [7, 8]
+
+
+def test_more_votes_win_more_often():
+    random.seed(1)
+    wins = Counter(pick_winners([1] * 9 + [2], 1)[0] for _ in range(1000))
+    assert wins[1] > wins[2] * 4
@@ -0,0 +1,47 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+import delivery_worker
+import models
+from alerts import DeliveryReport
+from models import Deliveries
+
+
+def test_batch_is_claimed_before_sending(monkeypatch):
+    engine = create_engine("sqlite://")
+    Deliveries.__table__.create(engine)
+    session_factory = sessionmaker(engine)
+    monkeypatch.setattr(models, "Session", session_factory)
+    monkeypatch.setattr(delivery_worker, "Session", session_factory)
+    now = datetime.now()
+    with session_factory() as session:
+        session.add_all(
+            [
+                Deliveries(id=1, channel=1, payload={}, attempts=0, available_at=now),
+                Deliveries(id=2, channel=2, payload={}, attempts=0, available_at=now),
+            ]
+        )
+        session.commit()
+
+    leases = []
+
+    async def send_payload(channel_id, payload):
+        # The claim is committed and visible before anything is sent.
+        with session_factory() as session:
+            stmt = select(Deliveries.available_at).where(Deliveries.id == channel_id)
+            leases.append(session.execute(stmt).scalar())
+        if channel_id == 2:
+            raise ConnectionError("network down")
+
+    monkeypatch.setattr(delivery_worker, "send_payload", send_payload)
+    report = DeliveryReport("test", prune=False)
+    assert asyncio.run(delivery_worker.process_batch(report)) == 2
+    assert all(lease >= now + delivery_worker.CLAIM_LEASE for lease in leases)
+
+    with session_factory() as session:
+        remaining = session.execute(select(Deliveries)).scalars().all()
+    assert [(delivery.id, delivery.attempts) for delivery in remaining] == [(2, 1)]
+    assert remaining[0].available_at < now + timedelta(minutes=2)
@@ -0,0 +1,25 @@
+import os
+
+from diagnostics import REPO_DIR, repo_site
+
+
+def test_repo_site_names_innermost_repo_frame():
+    frames = [
+        ("/usr/lib/python3/asyncio/events.py", 80, "_run"),
+        (os.path.join(REPO_DIR, "alerts.py"), 12, "price_alert"),
+        (os.path.join(REPO_DIR, "main.py"), 3, "main"),
+    ]
+    assert repo_site(frames) == "alerts.py:12 price_alert"
+
+
+def test_repo_site_skips_files():
+    profiler = os.path.join(REPO_DIR, "query_profiler.py")
+    frames = [
+        (profiler, 90, "after_execute"),
+        (os.path.join(REPO_DIR, "models.py"), 40, "select_records"),
+    ]
+    assert repo_site(frames, skip=(profiler,)) == "models.py:40 select_records"
+
+
+def test_repo_site_outside_repo():
+    assert repo_site([("/usr/lib/python3/json/decoder.py", 1, "decode")]) is None
@@ -0,0 +1,47 @@
+import asyncio
+import threading
+
+import ingest
+from metrics import metrics
+from models import GamePassData
+
+
+def make_source(alerts: list) -> ingest.Source:
+    async def fetch():
+        for key in (1, 2):
+            yield {"id": key, "title": f"game {key}"}
+
+    async def alert():
+        alerts.append(True)
+
+    return ingest.Source("test_source", GamePassData, "id", fetch, alert)
+
+
+def test_database_work_runs_off_the_loop(monkeypatch):
+    loop_thread = threading.get_ident()
+    threads = []
+
+    def is_empty(source):
+        threads.append(threading.get_ident())
+        return False
+
+    def apply_rows(source, buffer, first_load):
+        threads.append(threading.get_ident())
+        return [row.split(",")[0] for row in buffer.read().splitlines()]
+
+    monkeypatch.setattr(ingest, "is_empty", is_empty)
+    monkeypatch.setattr(ingest, "apply_rows", apply_rows)
+    before = metrics.counters["ingest.test_source.new_rows"]
+    alerts = []
+    assert asyncio.run(ingest.ingest(make_source(alerts))) == ["1", "2"]
+    assert loop_thread not in threads and len(threads) == 2
+    assert metrics.counters["ingest.test_source.new_rows"] == before + 2
+    assert alerts == [True]
+
+
+def test_first_load_sends_no_alerts(monkeypatch):
+    monkeypatch.setattr(ingest, "is_empty", lambda source: True)
+    monkeypatch.setattr(ingest, "apply_rows", lambda source, buffer, first: ["1"])
+    alerts = []
+    asyncio.run(ingest.ingest(make_source(alerts)))
+    assert alerts == []
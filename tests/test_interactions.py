@@ -0,0 +1,127 @@
+import asyncio
+import json
+from datetime import datetime
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from nacl.signing import SigningKey
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import alerts
+import handlers
+import interactions
+import votes
+from models import Votes
+
+
+def test_verify_checks_the_signature():
+    signing_key = SigningKey.generate()
+    public_key = signing_key.verify_key.encode().hex()
+    body, timestamp = b'{"type": 1}', "1700000000"
+    signature = signing_key.sign(timestamp.encode() + body).signature.hex()
+
+    assert interactions.verify(body, signature, timestamp, public_key)
+    assert not interactions.verify(b'{"type": 2}', signature, timestamp, public_key)
+    assert not interactions.verify(body, signature, "1700000001", public_key)
+    assert not interactions.verify(body, "not hex", timestamp, public_key)
+    other_key = SigningKey.generate().verify_key.encode().hex()
+    assert not interactions.verify(body, signature, timestamp, other_key)
+
+
+def test_verify_rejects_everything_without_a_key(monkeypatch):
+    monkeypatch.setattr(interactions, "DISCORD_PUBLIC_KEY", None)
+    assert not interactions.verify(b"{}", "00" * 64, "1700000000")
+
+
+def test_component_dispatch_passes_the_argument(monkeypatch):
+    monkeypatch.setattr(handlers, "component_handlers", {})
+    calls = []
+
+    @handlers.component_handler("delete_alert")
+    async def delete_alert(interaction, argument):
+        calls.append((interaction, argument))
+
+    assert asyncio.run(handlers.dispatch_component("interaction", "delete_alert:7:us"))
+    assert not asyncio.run(handlers.dispatch_component("interaction", "unknown:1"))
+    assert calls == [("interaction", "7:us")]
+
+
+def test_late_interactions_are_deferred():
+    deferred = interactions.deferred_response
+    assert deferred({"type": interactions.MESSAGE_COMPONENT}) == {"type": 6}
+    assert deferred({"type": interactions.APPLICATION_COMMAND}) == {"type": 5}
+    assert deferred({"type": interactions.MODAL_SUBMIT}) == {"type": 5}
+    assert deferred({"type": interactions.AUTOCOMPLETE}) == {
+        "type": 8,
+        "data": {"choices": []},
+    }
+
+
+def test_endpoint_sees_votes_recorded_by_the_gateway(monkeypatch):
+    engine = create_engine("sqlite://")
+    for table in [Votes, *alerts.alert_tables]:
+        table.__table__.create(engine)
+    session_factory = sessionmaker(engine)
+    monkeypatch.setattr(votes, "Session", session_factory)
+    monkeypatch.setattr(alerts, "Session", session_factory)
+    ledger = votes.VoteLedger()
+    monkeypatch.setattr(alerts, "vote_ledger", ledger)
+    monkeypatch.setattr(interactions, "vote_ledger", ledger)
+    monkeypatch.setattr(handlers, "component_handlers", {})
+    signing_key = SigningKey.generate()
+    monkeypatch.setattr(
+        interactions, "DISCORD_PUBLIC_KEY", signing_key.verify_key.encode().hex()
+    )
+
+    @handlers.component_handler("quota")
+    async def quota(interaction, _):
+        remaining, _ = alerts.alert_quota(interaction.guild_id, interaction.user.id)
+        await interaction.response.send_message(str(remaining))
+
+    def signed(user_id):
+        body = json.dumps(
+            {
+                "id": "1",
+                "application_id": "2",
+                "type": interactions.MESSAGE_COMPONENT,
+                "token": "token",
+                "version": 1,
+                "user": {
+                    "id": str(user_id),
+                    "username": "u",
+                    "discriminator": "0",
+                    "avatar": None,
+                },
+                "data": {"custom_id": "quota:", "component_type": 2},
+            }
+        ).encode()
+        timestamp = "1700000000"
+        signature = signing_key.sign(timestamp.encode() + body).signature.hex()
+        headers = {
+            "X-Signature-Ed25519": signature,
+            "X-Signature-Timestamp": timestamp,
+        }
+        return body, headers
+
+    async def run():
+        await ledger.load(follow=True)
+        # The gateway process records a vote after the endpoint loaded.
+        with session_factory() as session:
+            session.add(Votes(user=5, time=datetime.now(), source="webhook"))
+            session.commit()
+        app = web.Application()
+        app.router.add_post("/interactions", interactions.handle_interaction)
+        async with TestClient(TestServer(app)) as client:
+            results = []
+            for user_id in (5, 6):
+                body, headers = signed(user_id)
+                response = await client.post(
+                    "/interactions", data=body, headers=headers
+                )
+                results.append(await response.json())
+        return results
+
+    voter, other = asyncio.run(run())
+    assert voter["data"]["content"] == str(alerts.MAX_ALERTS)
+    assert other["data"]["content"] == str(alerts.MAX_ALERTS_WITHOUT_VOTE)
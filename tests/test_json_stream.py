@@ -0,0 +1,36 @@
+import json
+
+import pytest
+
+from price import JSONArrayStream
+
+
+def feed_in_chunks(parser: JSONArrayStream, data: bytes, size: int) -> list:
+    items = []
+    for i in range(0, len(data), size):
+        items += parser.feed(data[i : i + size])
+    return items + parser.feed(b"", final=True)
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 4096])
+def test_items_under_key_in_any_chunking(size):
+    apps = [{"appid": i, "name": f"Gäme {i}"} for i in range(50)]
+    data = json.dumps({"applist": {"apps": apps}}).encode()
+    assert feed_in_chunks(JSONArrayStream("apps"), data, size) == apps
+
+
+def test_top_level_array_of_numbers():
+    data = b"[12345, 678, 9]"
+    assert feed_in_chunks(JSONArrayStream(), data, 2) == [12345, 678, 9]
+
+
+def test_missing_key_yields_nothing():
+    data = json.dumps({"Products": None, "total": 0}).encode()
+    assert feed_in_chunks(JSONArrayStream("apps"), data, 5) == []
+
+
+def test_truncated_array_raises():
+    parser = JSONArrayStream()
+    parser.feed(b'[{"id": 1}, {"id"')
+    with pytest.raises(ValueError):
+        parser.feed(b"", final=True)
@@ -0,0 +1,66 @@
+from contextlib import contextmanager
+
+import migrations
+
+
+class Connection:
+    """Records the executed statements and answers the version query."""
+
+    def __init__(self, version: int):
+        self.version = version
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        self.statements.append((str(statement), params))
+        return self
+
+    def scalar(self):
+        return self.version
+
+
+class Engine:
+    def __init__(self, version: int):
+        self.conn = Connection(version)
+
+    @contextmanager
+    def begin(self):
+        yield self.conn
+
+
+def test_versions_are_consecutive():
+    versions = [number for number, _, _ in migrations.MIGRATIONS]
+    assert versions == list(range(1, len(versions) + 1))
+
+
+def test_pending_migrations_apply_in_order_under_the_lock():
+    *_, previous, last = migrations.MIGRATIONS
+    engine = Engine(version=previous[0] - 1)
+    assert migrations.migrate(engine) == [previous[0], last[0]]
+    statements = [statement for statement, _ in engine.conn.statements]
+    assert "pg_advisory_xact_lock" in statements[0]
+    recorded = [
+        params["version"]
+        for statement, params in engine.conn.statements
+        if statement.startswith("INSERT INTO schema_version")
+    ]
+    assert recorded == [previous[0], last[0]]
+    assert statements.index(previous[2][-1]) < statements.index(last[2][0])
+
+
+def test_current_schema_applies_nothing():
+    engine = Engine(version=migrations.MIGRATIONS[-1][0])
+    assert migrations.migrate(engine) == []
+    assert not any(
+        statement.startswith("INSERT") for statement, _ in engine.conn.statements
+    )
+
+
+def test_plan_indexes_are_collected_from_nested_plans():
+    plan = {
+        "Node Type": "Limit",
+        "Plans": [
+            {"Index Name": "ix_a", "Plans": [{"Index Name": "ix_b"}]},
+            {"Node Type": "Seq Scan"},
+        ],
+    }
+    assert migrations.plan_indexes(plan) == {"ix_a", "ix_b"}
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+from polling import PollScheduler, MIN_INTERVAL, MAX_INTERVAL, SALE_INTERVAL
+
+
+def make_scheduler(volatility: float = 0.0, sales: list = ()) -> PollScheduler:
+    scheduler = PollScheduler()
+    scheduler.volatility = lambda plain, region: volatility
+    scheduler.sales = list(sales)
+    scheduler._sales_loaded = datetime.now()
+    return scheduler
+
+
+def overview(price: float, cut: int = 0) -> dict:
+    return {"price": {"price": price, "cut": cut}}
+
+
+def test_unpolled_plains_are_due():
+    scheduler = make_scheduler()
+    assert scheduler.due({("us", "portal"): 10}) == [("us", "portal")]
+
+
+def test_polled_plains_wait_for_their_interval():
+    scheduler = make_scheduler()
+    scheduler.polled("us", {"portal": overview(40)}, {("us", "portal"): 10})
+    assert scheduler.due({("us", "portal"): 10}) == []
+    later = datetime.now() + MAX_INTERVAL
+    assert scheduler.due({("us", "portal"): 10}, now=later) == [("us", "portal")]
+
+
+def test_raised_threshold_is_due_immediately():
+    scheduler = make_scheduler()
+    scheduler.polled("us", {"portal": overview(40)}, {("us", "portal"): 10})
+    assert scheduler.due({("us", "portal"): 5}) == []
+    assert scheduler.due({("us", "portal"): 45}) == [("us", "portal")]
+
+
+def test_forgotten_plains_are_due_again():
+    scheduler = make_scheduler()
+    scheduler.polled("us", {"portal": overview(40)}, {("us", "portal"): 10})
+    scheduler.forget(set())
+    assert scheduler.next_due == {} and scheduler.polled_thresholds == {}
+    assert scheduler.due({("us", "portal"): 10}) == [("us", "portal")]
+
+
+def test_interval_shrinks_near_the_threshold():
+    scheduler = make_scheduler()
+    far = scheduler.interval("portal", "us", overview(100), 10)
+    near = scheduler.interval("portal", "us", overview(11), 10)
+    reached = scheduler.interval("portal", "us", overview(9), 10)
+    assert far == MAX_INTERVAL
+    assert MIN_INTERVAL < near < far
+    assert reached == MIN_INTERVAL
+
+
+def test_volatile_prices_are_polled_more_often():
+    calm = make_scheduler(volatility=0.0).interval("portal", "us", overview(20), 10)
+    volatile = make_scheduler(volatility=0.4).interval("portal", "us", overview(20), 10)
+    assert volatile == calm / 3
+
+
+def test_sales_cap_the_interval():
+    scheduler = make_scheduler()
+    assert scheduler.interval("portal", "us", overview(100, cut=20), 10) == (
+        SALE_INTERVAL
+    )
+    now = datetime.now()
+    sale = (now + timedelta(hours=2), now + timedelta(days=7))
+    upcoming = make_scheduler(sales=[sale]).interval("portal", "us", overview(100), 10)
+    assert upcoming == SALE_INTERVAL
+    later = (now + timedelta(days=3), now + timedelta(days=7))
+    distant = make_scheduler(sales=[later]).interval("portal", "us", overview(100), 10)
+    assert distant == MAX_INTERVAL
+
+
+def test_missing_prices_are_polled_soon():
+    assert make_scheduler().interval("portal", "us", {}, 10) == MIN_INTERVAL
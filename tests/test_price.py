@@ -0,0 +1,36 @@
+import asyncio
+from types import SimpleNamespace
+
+import price
+
+
+class Context:
+    guild = SimpleNamespace(id=1)
+
+    def __init__(self):
+        self.response = SimpleNamespace(defer=self.defer)
+        self.responses = []
+
+    async def defer(self):
+        pass
+
+    async def respond(self, content, **kwargs):
+        self.responses.append(content)
+
+
+def test_compare_without_matches_makes_no_lookups(monkeypatch):
+    async def fetch(*args):
+        raise AssertionError("nothing to look up")
+
+    monkeypatch.setattr(price.ServerSettings, "get_region", lambda server: "us")
+    monkeypatch.setattr(price, "fetch_itad_plains_by_steam_ids", fetch)
+    monkeypatch.setattr(price, "get_steam_appids", lambda titles: {"Portal": None})
+    monkeypatch.setattr(price, "get_closest_names", lambda name: [])
+    ctx = Context()
+    asyncio.run(price.compare_prices_response(ctx, ["nothing", "at all"]))
+    assert ctx.responses == ["None of these games could be found."]
+
+    monkeypatch.setattr(price, "get_closest_names", lambda name: ["Portal"])
+    ctx = Context()
+    asyncio.run(price.compare_prices_response(ctx, ["portal"]))
+    assert ctx.responses == ["None of these games could be found."]
@@ -0,0 +1,61 @@
+from collections import deque
+from datetime import datetime, timedelta
+
+import price_history
+from price_history import PriceHistoryStore
+
+
+def test_windows_are_bounded_least_recently_used_first():
+    store = PriceHistoryStore(max_windows=2)
+    store._load_rows(["a", "b"], "us", [])
+    assert store._missing(["a", "c"], "us") == ["c"]
+    store._load_rows(["c"], "us", [])
+    assert list(store.recent) == [("us", "a"), ("us", "c")]
+
+
+def test_loaded_rows_fill_their_windows():
+    store = PriceHistoryStore()
+    rows = [("a", None, 1999, 50, "Steam"), ("a", None, 999, 75, "GOG")]
+    store._load_rows(["a", "b"], "eu1", rows)
+    assert [obs.price for obs in store.recent[("eu1", "a")]] == [19.99, 9.99]
+    assert store.recent[("eu1", "b")] == deque()
+
+
+def test_unchanged_prices_are_not_stored_again(monkeypatch):
+    stored = []
+
+    class Session:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            pass
+
+        def execute(self, stmt, rows):
+            stored.extend(row["price_cents"] for row in rows)
+
+        def commit(self):
+            pass
+
+    monkeypatch.setattr(price_history, "Session", Session)
+    store = PriceHistoryStore()
+    store._load_rows(["a"], "us", [])
+    start = datetime.now()
+    for minutes, price in enumerate([19.99, 19.99, 9.99, 9.99, 19.99]):
+        overviews = {"a": {"price": {"price": price, "cut": 0, "store": "Steam"}}}
+        store.record_overviews(overviews, "us", start + timedelta(minutes=minutes))
+    assert stored == [1999, 999, 1999]
+    assert [obs.price for obs in store.recent[("us", "a")]] == [19.99, 9.99, 19.99]
+
+
+def test_price_in_effect_at_the_cutoff_counts():
+    store = PriceHistoryStore()
+    now = datetime.now()
+    rows = [
+        ("a", now - timedelta(days=40), 1999, 0, "Steam"),
+        ("a", now - timedelta(days=5), 999, 50, "Steam"),
+    ]
+    store._load_rows(["a"], "us", rows)
+    assert [obs.price for obs in store._since("a", "us", 30)] == [19.99, 9.99]
+    assert store.trend("a", "us", 30) < 0
+    assert store.lowest("a", "us", 3).price == 9.99
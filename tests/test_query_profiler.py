@@ -0,0 +1,17 @@
+from query_profiler import fingerprint
+
+
+def test_literals_are_normalized():
+    assert fingerprint("SELECT * FROM g2a WHERE title = 'It''s'  AND id = 42") == (
+        "SELECT * FROM g2a WHERE title = ? AND id = ?"
+    )
+
+
+def test_in_lists_of_any_length_match():
+    one = fingerprint("SELECT id FROM price_alerts WHERE id IN (1)")
+    three = fingerprint("SELECT id FROM price_alerts WHERE id IN (1, 2.5, 'x')")
+    assert one == three == "SELECT id FROM price_alerts WHERE id IN (?...)"
+
+
+def test_identifiers_with_digits_are_kept():
+    assert fingerprint("SELECT ix_1 FROM t2 LIMIT 20") == "SELECT ix_1 FROM t2 LIMIT ?"
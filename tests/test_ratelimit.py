@@ -0,0 +1,55 @@
+import asyncio
+
+from ratelimit import RequestBudget, INTERACTIVE, BACKGROUND, interactive
+
+
+def test_burst_is_served_without_waiting():
+    async def run():
+        budget = RequestBudget("test", rate=1, capacity=3)
+        for _ in range(3):
+            await asyncio.wait_for(budget.acquire(), 0.1)
+        assert budget.tokens < 1
+
+    asyncio.run(run())
+
+
+def test_interactive_requests_go_ahead_of_queued_background():
+    async def run():
+        budget = RequestBudget("test", rate=50, capacity=1)
+        await budget.acquire(BACKGROUND)
+        order = []
+
+        async def request(name, priority):
+            await budget.acquire(priority)
+            order.append(name)
+
+        background = [
+            asyncio.create_task(request(f"background {i}", BACKGROUND))
+            for i in range(3)
+        ]
+        await asyncio.sleep(0)
+        await request("interactive", INTERACTIVE)
+        await asyncio.gather(*background)
+        return order
+
+    order = asyncio.run(run())
+    assert order[0] == "interactive"
+    assert order[1:] == ["background 0", "background 1", "background 2"]
+
+
+def test_interactive_context_sets_the_priority():
+    async def run():
+        budget = RequestBudget("test", rate=50, capacity=1)
+        await budget.acquire()
+        queued = asyncio.create_task(budget.acquire())
+        await asyncio.sleep(0)
+        with interactive():
+            waiting = asyncio.create_task(budget.acquire())
+            await asyncio.sleep(0)
+        assert [priority for priority, _, _ in budget.waiters] == [
+            INTERACTIVE,
+            BACKGROUND,
+        ]
+        await asyncio.gather(queued, waiting)
+
+    asyncio.run(run())
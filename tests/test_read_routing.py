@@ -0,0 +1,72 @@
+import time
+
+import models
+
+
+class Primary:
+    """Stands in for Session on the primary and records its statements."""
+
+    statements = []
+    written = False
+
+    def __init__(self, **kwargs):
+        self.bind = kwargs.get("bind", "primary")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, stmt):
+        Primary.statements.append(stmt)
+        return self
+
+    def first(self):
+        return (1,) if Primary.written else None
+
+    def commit(self):
+        pass
+
+
+def use_replicas(monkeypatch, replicas: list) -> None:
+    Primary.statements = []
+    Primary.written = False
+    monkeypatch.setattr(models, "Session", Primary)
+    monkeypatch.setattr(models, "replica_engines", replicas)
+    monkeypatch.setattr(models, "_recent_writes", {})
+
+
+def test_without_replicas_everything_reads_the_primary(monkeypatch):
+    use_replicas(monkeypatch, [])
+    assert models.read_session(1).bind == "primary"
+    models.mark_written(1)
+    assert Primary.statements == []
+
+
+def test_reads_go_to_a_replica(monkeypatch):
+    use_replicas(monkeypatch, ["replica"])
+    assert models.read_session().bind == "replica"
+    assert models.read_session(1).bind == "replica"
+
+
+def test_local_writes_pin_reads_to_the_primary(monkeypatch):
+    use_replicas(monkeypatch, ["replica"])
+    models.mark_written(1)
+    assert len(Primary.statements) == 1
+    assert models.read_session(1).bind == "primary"
+    assert models.read_session(2).bind == "replica"
+
+
+def test_writes_of_other_processes_are_read_from_the_primary(monkeypatch):
+    use_replicas(monkeypatch, ["replica"])
+    Primary.written = True
+    assert models.written_recently(1)
+    assert models.read_session(1).bind == "primary"
+
+
+def test_local_marks_expire(monkeypatch):
+    use_replicas(monkeypatch, ["replica"])
+    window = models.READ_YOUR_WRITES_WINDOW.total_seconds()
+    models._recent_writes[1] = time.monotonic() - window - 1
+    assert not models.written_recently(1)
@@ -0,0 +1,33 @@
+import asyncio
+
+import supervisor
+from run_profiler import RunProfiler
+
+
+def test_targets_are_resolved_by_kind(monkeypatch):
+    profiler = RunProfiler()
+    sent = []
+
+    async def send(name, mode, duration, sampler, profile):
+        sent.append(name)
+
+    monkeypatch.setattr(profiler, "_send", send)
+    monkeypatch.setattr(supervisor, "run_profiler", profiler)
+    monkeypatch.setattr(supervisor, "supervised_tasks", [])
+
+    async def price_alert():
+        pass
+
+    task = supervisor.supervised(minutes=15)(price_alert)
+
+    async def run():
+        profiler.arm("command:price_alert")
+        await task()
+        assert profiler.armed == {"command:price_alert": "sampling"}
+        profiler.arm("task:price_alert")
+        await task()
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert sent == ["task:price_alert"]
+    assert profiler.armed == {"command:price_alert": "sampling"}
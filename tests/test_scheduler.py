@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+
+from scheduler import DeadlineScheduler
+
+
+async def handler():
+    pass
+
+
+def make_scheduler(rows: list, version: list) -> tuple[DeadlineScheduler, list]:
+    loads = []
+
+    def loader():
+        loads.append(list(rows))
+        return list(rows)
+
+    scheduler = DeadlineScheduler()
+    scheduler.register("kind", handler, loader, lambda: tuple(version))
+    return scheduler, loads
+
+
+def test_refresh_skips_unchanged_version():
+    when = datetime.now() + timedelta(hours=1)
+    scheduler, loads = make_scheduler([(1, when)], [1, when])
+    scheduler.refresh()
+    scheduler.refresh()
+    assert len(loads) == 1
+    assert scheduler._heap[0][0] == when
+
+
+def test_refresh_reloads_changed_version():
+    when = datetime.now() + timedelta(hours=1)
+    rows, version = [(1, when)], [1, when]
+    scheduler, loads = make_scheduler(rows, version)
+    scheduler.refresh()
+    rows.append((2, when + timedelta(minutes=5)))
+    version[:] = [2, when + timedelta(minutes=5)]
+    scheduler.refresh()
+    assert len(loads) == 2
+    assert len(scheduler._heap) == 2
+
+
+def test_force_refresh_ignores_version():
+    scheduler, loads = make_scheduler([], [0, None])
+    scheduler.refresh()
+    scheduler.refresh(force=True)
+    assert len(loads) == 2
+
+
+def test_reloaded_deadlines_are_not_duplicated():
+    when = datetime.now() + timedelta(hours=1)
+    scheduler, _ = make_scheduler([(1, when)], [1, when])
+    scheduler.refresh()
+    scheduler.refresh(force=True)
+    assert len(scheduler._heap) == 1
+
+
+def test_due_deadlines_pop_once_per_kind():
+    past = datetime.now() - timedelta(minutes=1)
+    scheduler, _ = make_scheduler([(1, past), (2, past)], [2, past])
+    scheduler.refresh()
+    assert scheduler._pop_due() == {"kind"}
+    assert scheduler._pop_due() == set()
+
+
+def test_pending_rows_are_retried_later():
+    past = datetime.now() - timedelta(minutes=1)
+    scheduler, _ = make_scheduler([(1, past)], [1, past])
+    scheduler.refresh()
+    scheduler._pop_due()
+    retry_at = datetime.now() + scheduler.retry_interval
+    scheduler.load("kind", retry_at=retry_at)
+    assert scheduler._pop_due() == set()
+    assert scheduler._heap[0][0] == retry_at
+
+
+def test_handler_reschedule_is_not_retried_twice():
+    past = datetime.now() - timedelta(minutes=1)
+    scheduler, _ = make_scheduler([(1, past)], [1, past])
+    scheduler.refresh()
+    scheduler._pop_due()
+    later = datetime.now() + timedelta(minutes=30)
+    scheduler.schedule("kind", 1, later)
+    scheduler.load("kind", retry_at=datetime.now() + scheduler.retry_interval)
+    assert [entry[0] for entry in scheduler._heap] == [later]
+
+
+def test_refresh_keeps_the_retry_backoff():
+    past = datetime.now() - timedelta(minutes=1)
+    rows = [(1, past)]
+    version = [1]
+    scheduler, _ = make_scheduler(rows, version)
+    scheduler.refresh()
+    scheduler._pop_due()
+    retry_at = datetime.now() + scheduler.retry_interval
+    scheduler.load("kind", retry_at=retry_at)
+    # A new row changes the version, the failing row still waits.
+    rows.append((2, datetime.now() + timedelta(hours=1)))
+    version.append(2)
+    scheduler.refresh()
+    assert scheduler._pop_due() == set()
+    assert sorted(entry[0] for entry in scheduler._heap)[0] == retry_at
+
+
+def test_rows_without_deadline_are_not_tracked():
+    scheduler, _ = make_scheduler([(1, None)], [1])
+    scheduler.refresh()
+    assert scheduler._scheduled == {} and scheduler._heap == []
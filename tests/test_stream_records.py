@@ -0,0 +1,29 @@
+from sqlalchemy import create_engine, delete
+from sqlalchemy.orm import sessionmaker
+
+import models
+from models import GamePassData, stream_records
+
+
+def test_chunks_are_read_by_primary_key(monkeypatch):
+    engine = create_engine("sqlite://")
+    GamePassData.__table__.create(engine)
+    session_factory = sessionmaker(engine)
+    monkeypatch.setattr(models, "Session", session_factory)
+    with session_factory() as session:
+        session.add_all(
+            [GamePassData(id=i, title=f"game {i}", alerted=i == 3) for i in range(7)]
+        )
+        session.commit()
+
+    chunks = stream_records(
+        GamePassData, ("title",), GamePassData.alerted == False, chunk_size=2
+    )
+    titles = []
+    for chunk in chunks:
+        titles.append([record.title for record in chunk])
+        # Rows handled by the caller between chunks do not shift the pages.
+        with session_factory() as session:
+            session.execute(delete(GamePassData).where(GamePassData.id == 0))
+            session.commit()
+    assert titles == [["game 0", "game 1"], ["game 2", "game 4"], ["game 5", "game 6"]]
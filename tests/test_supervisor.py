@@ -0,0 +1,79 @@
+import asyncio
+
+import supervisor
+from supervisor import SupervisedTask, supervised
+
+
+def make_task(monkeypatch, coro, **kwargs) -> tuple[SupervisedTask, list]:
+    reports = []
+
+    async def report(message):
+        reports.append(message)
+
+    monkeypatch.setattr(supervisor, "report", report)
+    monkeypatch.setattr(supervisor, "supervised_tasks", [])
+    return supervised(**kwargs)(coro), reports
+
+
+def test_runs_over_budget_fail_and_are_reported(monkeypatch):
+    async def slow():
+        await asyncio.sleep(1)
+
+    task, reports = make_task(monkeypatch, slow, seconds=60, timeout=0.01)
+    assert not asyncio.run(task())
+    assert task.failures == 1 and not task.running
+    assert "exceeded its 0s budget" in reports[0]
+
+
+def test_failures_back_off_and_reset(monkeypatch):
+    outcomes = [ValueError("down"), ValueError("down"), None]
+
+    async def flaky():
+        outcome = outcomes.pop(0)
+        if outcome:
+            raise outcome
+
+    task, reports = make_task(monkeypatch, flaky, hours=1)
+    assert task.next_delay() == 3600
+    asyncio.run(task())
+    asyncio.run(task())
+    assert task.failures == 2 and len(reports) == 2
+    assert task.next_delay() == supervisor.BACKOFF_START * 2
+    assert asyncio.run(task())
+    assert task.failures == 0 and task.last_success is not None
+
+
+def test_overlapping_runs_are_skipped(monkeypatch):
+    async def job():
+        await asyncio.sleep(0.01)
+
+    task, _ = make_task(monkeypatch, job, seconds=60)
+
+    async def run():
+        return await asyncio.gather(task(), task())
+
+    assert asyncio.run(run()) == [True, False]
+
+
+def test_crashed_loop_is_restarted(monkeypatch):
+    async def job():
+        pass
+
+    task, _ = make_task(monkeypatch, job, seconds=0.01, jitter=0)
+    loops = []
+
+    async def loop():
+        loops.append(True)
+        if len(loops) == 1:
+            raise RuntimeError("loop crashed")
+        await asyncio.sleep(1)
+
+    monkeypatch.setattr(task, "_loop", loop)
+
+    async def run():
+        task.start()
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+    asyncio.run(run())
+    assert len(loops) == 2 and task.failures == 1
@@ -0,0 +1,79 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+import votes
+from models import Votes
+from votes import VoteLedger, month_start
+
+
+def make_ledger(monkeypatch, rows: list, topgg_votes: list = ()) -> tuple:
+    engine = create_engine("sqlite://")
+    Votes.__table__.create(engine)
+    session_factory = sessionmaker(engine)
+    monkeypatch.setattr(votes, "Session", session_factory)
+    with session_factory() as session:
+        session.add_all(
+            [Votes(user=user, time=when, source="webhook") for user, when in rows]
+        )
+        session.commit()
+
+    async def get_bot_votes():
+        return [{"id": str(user)} for user in topgg_votes]
+
+    topggpy = SimpleNamespace(get_bot_votes=get_bot_votes)
+    monkeypatch.setattr(votes, "bot", SimpleNamespace(topggpy=topggpy))
+    return VoteLedger(), session_factory
+
+
+def test_empty_month_is_backfilled_once(monkeypatch):
+    ledger, session_factory = make_ledger(monkeypatch, [], topgg_votes=[1, 1, 2])
+    asyncio.run(ledger.load())
+    assert sorted(ledger.voters()) == [1, 1, 2]
+    # Backfilled votes have no time, they are recorded at the month start.
+    assert ledger.latest[1] == ledger.month
+    asyncio.run(ledger.load())
+    with session_factory() as session:
+        sources = session.execute(select(Votes.source)).scalars().all()
+    assert sources == ["backfill"] * 3
+
+
+def test_month_with_votes_is_not_backfilled(monkeypatch):
+    now = datetime.now()
+    ledger, _ = make_ledger(monkeypatch, [(1, now)], topgg_votes=[2])
+    asyncio.run(ledger.load())
+    assert ledger.voters() == [1]
+    assert ledger.has_voted(1) and not ledger.has_voted(2)
+
+
+def test_votes_count_for_the_month_and_the_vote_window(monkeypatch):
+    now = datetime.now()
+    rows = [(1, month_start() - timedelta(days=1)), (2, now - timedelta(hours=13))]
+    ledger, _ = make_ledger(monkeypatch, rows)
+    asyncio.run(ledger.load())
+    assert 1 not in ledger.voters()
+    assert not ledger.has_voted(2)
+    ledger.record(3)
+    assert ledger.has_voted(3) and 3 in ledger.voters()
+
+
+def test_counts_reset_with_the_month(monkeypatch):
+    ledger, _ = make_ledger(monkeypatch, [])
+    ledger.record(1)
+    ledger.month -= timedelta(days=40)
+    assert ledger.voters() == []
+    assert ledger.month == month_start()
+
+
+def test_following_ledger_reads_new_votes(monkeypatch):
+    ledger, session_factory = make_ledger(monkeypatch, [], topgg_votes=[5])
+    asyncio.run(ledger.load(follow=True))
+    assert ledger.voters() == []
+    with session_factory() as session:
+        session.add(Votes(user=4, time=datetime.now(), source="webhook"))
+        session.commit()
+    assert ledger.has_voted(4)
+    assert ledger.voters() == [4]
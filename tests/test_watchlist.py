@@ -0,0 +1,27 @@
+from alerts import parse_watchlist
+
+
+def test_titles_app_ids_and_links():
+    text = "Portal 2\n620\nhttps://store.steampowered.com/app/400/Portal/\n"
+    assert parse_watchlist(text, 10.0) == [
+        ("Portal 2", None, 10.0),
+        ("620", 620, 10.0),
+        ("https://store.steampowered.com/app/400/Portal/", 400, 10.0),
+    ]
+
+
+def test_price_overrides():
+    text = "Hades | 12.5\nCeleste | $4\nOri |\n"
+    assert parse_watchlist(text, 20.0) == [
+        ("Hades", None, 12.5),
+        ("Celeste", None, 4.0),
+        ("Ori", None, 20.0),
+    ]
+
+
+def test_invalid_price_falls_back_to_default():
+    assert parse_watchlist("Hades | cheap", 15.0) == [("Hades", None, 15.0)]
+
+
+def test_blank_lines_are_skipped():
+    assert parse_watchlist("\n  \nHades\n\n", 5.0) == [("Hades", None, 5.0)]
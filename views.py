@@ -1,57 +1,161 @@
 import discord
+from collections import deque
 from price import PriceInfo
-from models import PriceAlerts
+from models import PriceAlerts, ServerSettings, format_price
 import json
 
-from alerts import alert_check
+from alerts import alert_check, import_watchlist
+from bot import LOW_MEMORY
+from handlers import component_handler
 
+# Price lookup views that can be open at once, and how long they stay open.
+# When more are open, the oldest views stop early and free their PriceInfo.
+MAX_LIVE_VIEWS = 200 if LOW_MEMORY else 1000
+VIEW_TIMEOUT = 120 if LOW_MEMORY else 180
+live_views = deque()
 
+
+def track_view(view: discord.ui.View) -> None:
+    while live_views and live_views[0].is_finished():
+        live_views.popleft()
+    live_views.append(view)
+    while len(live_views) > MAX_LIVE_VIEWS:
+        live_views.popleft().stop()
+
+
+# Components and modals carry their state in their custom_id, so that the
+# stateless handlers of the HTTP interactions endpoint can answer them too.
 class CreateAlertView(discord.ui.View):
     def __init__(self, info: PriceInfo):
-        super().__init__()
+        super().__init__(timeout=VIEW_TIMEOUT)
         self.info = info
+        button = discord.ui.Button(
+            label="Create Alert",
+            style=discord.ButtonStyle.red,
+            custom_id=f"create_alert:{info.game_plain}",
+        )
+        button.callback = self.alert_button
+        self.add_item(button)
+        track_view(self)
 
-    @discord.ui.button(label="Create Alert", style=discord.ButtonStyle.red)
-    async def alert_button(
-        self, button: discord.ui.Button, interaction: discord.Interaction
-    ):
-        modal = CreateAlertModal(self.info)
+    async def alert_button(self, interaction: discord.Interaction):
+        modal = CreateAlertModal(
+            self.info.game_plain, self.info.game_name, self.info.image, self.info.region
+        )
         await interaction.response.send_modal(modal=modal)
 
 
 class CreateAlertModal(discord.ui.Modal):
-    def __init__(self, info: PriceInfo):
+    def __init__(self, game_plain: str, game_name: str, image: str, region: str):
         super().__init__(
             discord.ui.InputText(
-                label="Target Price", placeholder="$20", min_length=1, max_length=4
+                label="Target Price", placeholder="$19.99", min_length=1, max_length=10
             ),
             title="Price Alert",
+            custom_id=f"create_alert_modal:{game_plain}",
         )
-        self.info = info
+        self.game_plain = game_plain
+        self.game_name = game_name
+        self.image = image
+        self.region = region
 
     async def callback(self, interaction: discord.Interaction):
-        
-        await interaction.response.defer()
-        response = await alert_check(interaction.guild.id, interaction.user.id)
-        if response == True:
-            price = self.children[0].value.replace("$", "")
-            try:
-                price = int(float(price))
-                PriceAlerts.add_alert(
-                    interaction,
-                    game_name=self.info.game_name,
-                    image_url=self.info.image,
-                    price=price,
-                    game_plain=self.info.game_plain,
-                )
-                response = f"Price Alert for `{self.info.game_name}` created."
-                await interaction.response.send_message(response)
-            except ValueError:
-                response = f"Target price must be a number. You input `{price}`."
-                await interaction.response.send_message(response, ephemeral=True)
-        
-        else:
-            await interaction.response.send_message(response)
+        await create_price_alert(
+            interaction,
+            self.children[0].value,
+            self.game_plain,
+            self.game_name,
+            self.image,
+            self.region,
+        )
+
+
+async def create_price_alert(
+    interaction: discord.Interaction,
+    price: str,
+    game_plain: str,
+    game_name: str,
+    image: str,
+    region: str,
+):
+    await interaction.response.defer()
+    response = await alert_check(interaction.guild.id, interaction.user.id)
+    if response == True:
+        price = price.replace("$", "")
+        try:
+            price = round(float(price), 2)
+            PriceAlerts.add_alert(
+                interaction,
+                game_name=game_name,
+                image_url=image,
+                price=price,
+                game_plain=game_plain,
+                region=region,
+            )
+            response = f"Price Alert for `{game_name}` created."
+            await interaction.followup.send(response)
+        except ValueError:
+            response = f"Target price must be a number. You input `{price}`."
+            await interaction.followup.send(response, ephemeral=True)
+    else:
+        await interaction.followup.send(response)
+
+
+def lookup_details(interaction: discord.Interaction) -> tuple:
+    """Reads the game name and image back from the price lookup embed."""
+    embed = interaction.message.embeds[0]
+    return embed.title, embed.image.url or None
+
+
+@component_handler("create_alert")
+async def open_alert_modal(interaction: discord.Interaction, game_plain: str):
+    game_name, image = lookup_details(interaction)
+    region = ServerSettings.get_region(interaction.guild_id)
+    modal = CreateAlertModal(game_plain, game_name, image, region)
+    await interaction.response.send_modal(modal=modal)
+
+
+@component_handler("create_alert_modal")
+async def submit_alert_modal(interaction: discord.Interaction, game_plain: str):
+    game_name, image = lookup_details(interaction)
+    region = ServerSettings.get_region(interaction.guild_id)
+    price = interaction.data["components"][0]["components"][0]["value"]
+    await create_price_alert(interaction, price, game_plain, game_name, image, region)
+
+
+class WatchlistImportModal(discord.ui.Modal):
+    """Takes a pasted list of games and creates a price alert for each."""
+
+    def __init__(self, target_price: float):
+        super().__init__(
+            discord.ui.InputText(
+                label="Games",
+                placeholder="One title, steam app id or store link per line.\n"
+                "Add `| 15` to a line to use a different target price.",
+                style=discord.InputTextStyle.long,
+                max_length=4000,
+            ),
+            title="Import Watchlist",
+            custom_id=f"import_watchlist:{target_price}",
+        )
+        self.target_price = target_price
+
+    async def callback(self, interaction: discord.Interaction):
+        await submit_watchlist(interaction, self.children[0].value, self.target_price)
+
+
+async def submit_watchlist(
+    interaction: discord.Interaction, text: str, target_price: float
+):
+    await interaction.response.defer()
+    response = await import_watchlist(interaction, text, target_price)
+    await interaction.followup.send(response)
+
+
+@component_handler("import_watchlist")
+async def submit_watchlist_modal(interaction: discord.Interaction, target_price: str):
+    text = interaction.data["components"][0]["components"][0]["value"]
+    await submit_watchlist(interaction, text, float(target_price))
 
 
 class PriceAlertDropdown(discord.ui.Select):
@@ -65,7 +169,7 @@ class PriceAlertDropdown(discord.ui.Select):
         options = []
         values = []
         for alert in alerts:
-            label = f"{alert.game_name} under ${alert.price}"
+            label = f"{alert.game_name} under {format_price(alert.price, alert.region)}"
             value = {
                 "channel": alert.channel,
                 "game_name": alert.game_name[0:10],
@@ -80,25 +184,37 @@ class PriceAlertDropdown(discord.ui.Select):
                 continue
 
         super().__init__(
-            placeholder="Choose an alert to delete.", min_values=1, options=options
+            placeholder="Choose an alert to delete.",
+            min_values=1,
+            options=options,
+            custom_id="delete_price_alert",
         )
 
     async def callback(self, interaction: discord.Interaction):
-        from alerts import delete_server_alerts
-
-        alert = json.loads(self.values[0])
-        game_name = alert["game_name"]
-        channel = alert["channel"]
-        price = alert["price"]
-        delete_server_alerts(
-            interaction.guild.id,
-            PriceAlerts,
-            game_name=game_name,
-            channel=channel,
-            price=price,
-        )
-        response = f"Price alert deleted."
-        await interaction.response.send_message(response)
+        await delete_price_alert(interaction, self.values[0])
+
+
+@component_handler("delete_price_alert")
+async def delete_price_alert_select(interaction: discord.Interaction, _):
+    await delete_price_alert(interaction, interaction.data["values"][0])
+
+
+async def delete_price_alert(interaction: discord.Interaction, value: str):
+    from alerts import delete_server_alerts
+
+    alert = json.loads(value)
+    game_name = alert["game_name"]
+    channel = alert["channel"]
+    price = alert["price"]
+    delete_server_alerts(
+        interaction.guild.id,
+        PriceAlerts,
+        game_name=game_name,
+        channel=channel,
+        price=price,
+    )
+    response = "Price alert deleted."
+    await interaction.response.send_message(response)
 
 
 class VoteButton(discord.ui.View):
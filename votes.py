@@ -0,0 +1,124 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from bot import bot
+from models import Session, Votes
+
+# How long a top.gg vote counts towards the higher alert limit.
+VOTE_WINDOW = timedelta(hours=12)
+
+
+def month_start(now: datetime = None) -> datetime:
+    now = now or datetime.now()
+    return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+class VoteLedger:
+    """Local record of the votes received through the top.gg webhook.
+
+    Every vote is stored in the votes table and mirrored in memory, so vote
+    checks and giveaway voter lists are answered without calling top.gg.
+    top.gg is only queried to backfill a month that has no local votes.
+
+    Processes without the webhook follow the table instead: a vote check
+    that misses reads the votes added since the last read."""
+
+    def __init__(self):
+        self.month = month_start()
+        self.latest = {}
+        self.counts = Counter()
+        self.loaded = False
+        self.follow = False
+        self.last_id = 0
+
+    def _remember(self, user_id: int, when: datetime) -> None:
+        if when >= self.month:
+            self.counts[user_id] += 1
+        if when > self.latest.get(user_id, datetime.min):
+            self.latest[user_id] = when
+
+    def _roll_month(self) -> None:
+        """Votes reset each month, so the monthly counts are cleared."""
+        if month_start() != self.month:
+            self.month = month_start()
+            self.counts.clear()
+
+    async def load(self, follow: bool = False) -> None:
+        """Loads this month's votes and any older ones still inside the vote
+        window, backfilling from top.gg when this month has none. Following
+        ledgers leave the backfill to the process that receives the votes."""
+        self.month = month_start()
+        self.follow = follow
+        since = min(self.month, datetime.now() - VOTE_WINDOW)
+        with Session() as session:
+            stmt = select(Votes.id, Votes.user, Votes.time).where(Votes.time >= since)
+            rows = session.execute(stmt).all()
+            self.last_id = session.execute(select(func.max(Votes.id))).scalar() or 0
+        self.latest.clear()
+        self.counts.clear()
+        for _, user_id, when in rows:
+            self._remember(user_id, when)
+        if not follow and not any(when >= self.month for _, _, when in rows):
+            for user_id, when in await self.backfill():
+                self._remember(user_id, when)
+        self.loaded = True
+
+    async def backfill(self) -> list[tuple]:
+        """Copies this month's votes from top.gg. top.gg does not return vote
+        times, so they are recorded at the start of the month: they count for
+        giveaways but not towards the 12 hour vote window."""
+        if not hasattr(bot, "topggpy"):
+            return []
+        votes = await bot.topggpy.get_bot_votes()
+        rows = [(int(vote["id"]), self.month) for vote in votes]
+        if rows:
+            values = [
+                {"user": user_id, "time": when, "source": "backfill"}
+                for user_id, when in rows
+            ]
+            with Session() as session:
+                session.execute(insert(Votes), values)
+                session.commit()
+        return rows
+
+    def record(self, user_id: int, when: datetime = None) -> None:
+        """Stores a vote received through the webhook."""
+        when = when or datetime.now()
+        self._roll_month()
+        with Session() as session:
+            session.add(Votes(user=user_id, time=when, source="webhook"))
+            session.commit()
+        self._remember(user_id, when)
+
+    def refresh(self) -> None:
+        """Reads the votes stored by other processes since the last read."""
+        self._roll_month()
+        with Session() as session:
+            stmt = (
+                select(Votes.id, Votes.user, Votes.time)
+                .where(Votes.id > self.last_id)
+                .order_by(Votes.id)
+            )
+            for vote_id, user_id, when in session.execute(stmt):
+                self._remember(user_id, when)
+                self.last_id = vote_id
+
+    def _voted(self, user_id: int) -> bool:
+        return self.latest.get(user_id, datetime.min) >= datetime.now() - VOTE_WINDOW
+
+    def has_voted(self, user_id: int) -> bool:
+        """Whether the user voted within the last 12 hours."""
+        if not self._voted(user_id) and self.follow:
+            self.refresh()
+        return self._voted(user_id)
+
+    def voters(self) -> list[int]:
+        """This month's voters, listed once per vote so voting often
+        increases the chance of winning giveaways."""
+        self._roll_month()
+        return list(self.counts.elements())
+
+
+vote_ledger = VoteLedger()
@@ -4,7 +4,9 @@ from datetime import datetime
 import traceback
 
 from bot import bot
-from alerts import server_alert_count
+from query_profiler import profiler
+from run_profiler import run_profiler
+from ratelimit import interactive
 
 
 def command_streaming():
@@ -17,7 +19,7 @@ def command_streaming():
             details = (
                 f"Command: `{func.__name__}`\n"
                 f"Server: `{args[0].guild.name}`\n"
-                f"Channel: `{args[0].channel.name}`\n"
+                f"Channel: `{getattr(args[0].channel, 'name', args[0].channel_id)}`\n"
                 f"Member: `{args[0].author.name}`\n"
             )
             embed.add_field(name="Details", value=details, inline=False)
@@ -27,7 +29,9 @@ def command_streaming():
             channel = await bot.fetch_channel(bot.stream_channel)
             try:
                 await channel.send(embed=embed)
-                return await func(*args, **kwargs)
+                with profiler.run(func.__name__), interactive():
+                    with run_profiler.capture(f"command:{func.__name__}", func):
+                        return await func(*args, **kwargs)
             except Exception as exc:
                 response = (
                     "Something went wrong. An error message was sent "